@@ -0,0 +1,276 @@
+import os
+import pandas as pd
+import streamlit as st
+from db import DB_PATH, read_sql, get_write_connection
+
+# Agregados materializados por jugador: se calculan al sincronizar y las páginas leen una fila
+AGG_STATS = ['pts', 'reb', 'ast', 'fg3m', 'min']
+FORM_STATS = ['pts', 'reb', 'ast']
+ROLLING_WINDOWS = (5, 10)
+FLOOR_WINDOW = 10
+PERCENTILES = (0.25, 0.5)
+SOURCE_COLUMNS = ['player_name', 'team_abbreviation', 'game_date', 'opponent_abbreviation',
+                  'pts', 'reb', 'ast', 'fg3m', 'fgm', 'ftm', 'min']
+
+MAX_IN_PARAMS = 900  # por encima se rehace todo (límite de parámetros de SQLite)
+
+_state = {'checked': False}
+
+def _prepare_logs(logs):
+    logs = logs.assign(
+        player_name=logs['player_name'].astype(str),
+        game_date=pd.to_datetime(logs['game_date'])
+    ).sort_values(['player_name', 'game_date'], kind='stable')
+    stats = logs[AGG_STATS].astype('float64')
+    stats['pts_3'] = logs['fg3m'] * 3
+    stats['pts_ft'] = logs['ftm'].astype('float64')
+    stats['pts_2'] = (logs['fgm'] - logs['fg3m']) * 2
+    stats['player_name'] = logs['player_name']
+    return logs, stats
+
+def build_player_aggregates(logs):
+    """
+    Una fila por jugador: medias de temporada, desglose 2PT/3PT/TL, medias de los
+    últimos 5/10, suelo (2º valor más bajo de los últimos 10) y percentiles.
+    """
+    if logs.empty:
+        return pd.DataFrame()
+    logs, stats = _prepare_logs(logs)
+    g = stats.groupby('player_name', sort=False)
+
+    agg = g[AGG_STATS + ['pts_2', 'pts_3', 'pts_ft']].mean()
+    agg.insert(0, 'gp', g.size())
+
+    # Posición de cada partido contando desde el más reciente del jugador
+    pos_from_end = g.cumcount(ascending=False)
+    for n in ROLLING_WINDOWS:
+        last_n = stats[pos_from_end < n].groupby('player_name', sort=False)[FORM_STATS].mean()
+        agg = agg.join(last_n.add_prefix(f'last{n}_'))
+
+    window = stats[pos_from_end < FLOOR_WINDOW]
+    gw = window.groupby('player_name', sort=False)
+    for stat in FORM_STATS:
+        rank = gw[stat].rank(method='first')
+        second = window.loc[rank == 2, ['player_name', stat]].set_index('player_name')[stat]
+        # Con un solo partido el suelo es ese mismo valor
+        agg[f'floor_{stat}'] = second.reindex(agg.index).fillna(gw[stat].min())
+        for q in PERCENTILES:
+            agg[f'p{int(q * 100)}_{stat}'] = g[stat].quantile(q)
+
+    last_rows = logs.groupby('player_name', sort=False).tail(1).set_index('player_name')
+    agg['team_abbreviation'] = last_rows['team_abbreviation'].astype(str)
+    agg['last_game_date'] = last_rows['game_date'].dt.strftime('%Y-%m-%d')
+    return agg.reset_index()
+
+def build_opponent_splits(logs):
+    """Medias de cada jugador contra cada rival."""
+    if logs.empty:
+        return pd.DataFrame()
+    logs, stats = _prepare_logs(logs)
+    stats['opponent'] = logs['opponent_abbreviation'].astype(str)
+    g = stats.groupby(['player_name', 'opponent'], sort=False)
+    splits = g[AGG_STATS].mean()
+    splits.insert(0, 'gp', g.size())
+    return splits.reset_index()
+
+def build_team_players(logs):
+    """
+    Totales de temporada de cada jugador en cada equipo por el que ha pasado (sumas y GP).
+    `is_current` marca el equipo de su último partido.
+    """
+    if logs.empty:
+        return pd.DataFrame()
+    logs, stats = _prepare_logs(logs)
+    stats['team_abbreviation'] = logs['team_abbreviation'].astype(str)
+    g = stats.groupby(['team_abbreviation', 'player_name'], sort=False)
+    totals = g[AGG_STATS].sum()
+    totals.insert(0, 'gp', g.size())
+    totals = totals.reset_index()
+    current = stats.groupby('player_name', sort=False)['team_abbreviation'].last()
+    totals['is_current'] = (totals['player_name'].map(current) == totals['team_abbreviation']).astype(int)
+    return totals
+
+def _table_exists(conn, table):
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (table,)
+    ).fetchone() is not None
+
+def refresh_player_aggregates(conn, players=None):
+    """
+    Recalcula `player_agg`, `player_opp_agg` y `team_player` desde `player`.
+    Con `players` solo se rehacen las filas de esos jugadores (sincronización incremental).
+    """
+    if not _table_exists(conn, 'player'):
+        return
+    if players is not None and not all(_table_exists(conn, t) for t in ('player_agg', 'player_opp_agg', 'team_player')):
+        players = None
+    players = sorted(set(players)) if players is not None else None
+    if players == []:
+        return
+    if players is not None and len(players) > MAX_IN_PARAMS:
+        players = None
+
+    query = f"SELECT {', '.join(SOURCE_COLUMNS)} FROM player"
+    where, params = "", []
+    if players is not None:
+        where = f" WHERE player_name IN ({', '.join('?' * len(players))})"
+        params = players
+    logs = pd.read_sql_query(query + where, conn, params=params)
+
+    for table, builder in (('player_agg', build_player_aggregates), ('player_opp_agg', build_opponent_splits),
+                           ('team_player', build_team_players)):
+        frame = builder(logs)
+        if players is None:
+            conn.execute(f'DROP TABLE IF EXISTS {table};')
+        else:
+            conn.execute(f'DELETE FROM {table}' + where, params)
+        if not frame.empty:
+            frame.to_sql(table, conn, if_exists='append', index=False)
+    conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_agg_player ON player_agg(player_name);')
+    conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_opp_agg ON player_opp_agg(player_name, opponent);')
+    conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_team_player ON team_player(team_abbreviation, player_name);')
+    conn.commit()
+
+# Box score por equipo y partido (suma de los jugadores) con métricas derivadas
+TEAM_SUM_STATS = ['pts', 'reb', 'ast', 'fgm', 'fga', 'fg3m', 'fg3a', 'ftm', 'fta', 'oreb', 'tov', 'min']
+TEAM_INFO_COLUMNS = ['game_date', 'matchup', 'opponent_abbreviation', 'is_home', 'wl']
+
+def build_team_games(logs):
+    """
+    Una fila por (game_id, equipo): totales, FG% y ritmo estimado
+    (posesiones = FGA + 0.44·FTA − OREB + TOV, llevadas a 48 minutos).
+    """
+    if logs.empty:
+        return pd.DataFrame()
+    stats = [c for c in TEAM_SUM_STATS if c in logs.columns]
+    info = [c for c in TEAM_INFO_COLUMNS if c in logs.columns]
+    logs = logs.assign(team_abbreviation=logs['team_abbreviation'].astype(str))
+    g = logs.groupby(['game_id', 'team_abbreviation'], sort=False)
+    team = g[info].first().join(g[stats].sum())
+    for col in ('matchup', 'opponent_abbreviation', 'wl'):
+        if col in team.columns:
+            team[col] = team[col].astype(str)
+
+    fga = team['fga'].where(team['fga'] > 0)
+    team['fg_pct'] = team['fgm'] / fga
+    possessions = team['fga'] + 0.44 * team['fta'] - team['oreb'] + team['tov']
+    team['pace'] = possessions * 48 / (team['min'].where(team['min'] > 0) / 5)
+    return team.reset_index()
+
+def refresh_team_games(conn, game_ids=None):
+    """Recalcula `team_game` desde `player`; con `game_ids` solo esos partidos."""
+    if not _table_exists(conn, 'player'):
+        return
+    if game_ids is not None and not _table_exists(conn, 'team_game'):
+        game_ids = None
+    game_ids = sorted(set(game_ids)) if game_ids is not None else None
+    if game_ids == []:
+        return
+    if game_ids is not None and len(game_ids) > MAX_IN_PARAMS:
+        game_ids = None
+
+    available = [r[1] for r in conn.execute('PRAGMA table_info(player)')]
+    cols = [c for c in ['game_id', 'team_abbreviation'] + TEAM_INFO_COLUMNS + TEAM_SUM_STATS if c in available]
+    where, params = "", []
+    if game_ids is not None:
+        where = f" WHERE game_id IN ({', '.join('?' * len(game_ids))})"
+        params = game_ids
+    logs = pd.read_sql_query(f"SELECT {', '.join(cols)} FROM player" + where, conn, params=params)
+    if 'game_date' in logs.columns:
+        logs['game_date'] = pd.to_datetime(logs['game_date']).dt.strftime('%Y-%m-%d')
+
+    frame = build_team_games(logs)
+    if game_ids is None:
+        conn.execute('DROP TABLE IF EXISTS team_game;')
+    else:
+        conn.execute('DELETE FROM team_game' + where, params)
+    if not frame.empty:
+        frame.to_sql('team_game', conn, if_exists='append', index=False)
+        conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_team_game ON team_game(game_id, team_abbreviation);')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_team_game_opp ON team_game(team_abbreviation, opponent_abbreviation, game_date);')
+    conn.commit()
+
+def _ensure_aggregates():
+    """Bases anteriores a los agregados: se construyen una vez a partir de `player`."""
+    if _state['checked'] or not os.path.exists(DB_PATH):
+        return
+    try:
+        read_sql('SELECT 1 FROM player_agg LIMIT 1')
+        read_sql('SELECT 1 FROM player_opp_agg LIMIT 1')
+        read_sql('SELECT 1 FROM team_player LIMIT 1')
+        read_sql('SELECT matchup FROM team_game LIMIT 1')
+    except Exception:
+        conn = get_write_connection()
+        try:
+            refresh_player_aggregates(conn)
+            refresh_team_games(conn)
+        finally:
+            conn.close()
+    _state['checked'] = True
+
+@st.cache_data(ttl=86400, show_spinner=False)
+def load_player_aggregates():
+    """Tabla de agregados de toda la liga indexada por jugador (vacía si no hay datos)."""
+    _ensure_aggregates()
+    try:
+        agg = read_sql('SELECT * FROM player_agg')
+    except Exception:
+        return pd.DataFrame()
+    if agg.empty:
+        return agg
+    return agg.set_index('player_name')
+
+@st.cache_data(ttl=86400, show_spinner=False)
+def load_latest_teams():
+    """{jugador: equipo de su último partido}, leído de `player_agg` (se recalcula al sincronizar)."""
+    _ensure_aggregates()
+    try:
+        teams = read_sql('SELECT player_name, team_abbreviation FROM player_agg')
+    except Exception:
+        return {}
+    return dict(zip(teams['player_name'], teams['team_abbreviation']))
+
+def get_player_aggregates(player_name):
+    """Fila de agregados de un jugador (consulta por índice). None si no existe."""
+    _ensure_aggregates()
+    try:
+        row = read_sql('SELECT * FROM player_agg WHERE player_name = ?', [player_name])
+    except Exception:
+        return None
+    return row.iloc[0] if not row.empty else None
+
+def get_opponent_split(player_name, opponent):
+    """Medias de un jugador contra un rival. None si nunca se han enfrentado."""
+    _ensure_aggregates()
+    try:
+        row = read_sql('SELECT * FROM player_opp_agg WHERE player_name = ? AND opponent = ?',
+                       [player_name, opponent])
+    except Exception:
+        return None
+    return row.iloc[0] if not row.empty else None
+
+def get_team_games(teams, opponents=None):
+    """Box scores de equipo (tabla `team_game`) de `teams`, opcionalmente solo contra `opponents`."""
+    _ensure_aggregates()
+    teams = list(teams)
+    query = f"SELECT * FROM team_game WHERE team_abbreviation IN ({', '.join('?' * len(teams))})"
+    params = teams
+    if opponents is not None:
+        opponents = list(opponents)
+        query += f" AND opponent_abbreviation IN ({', '.join('?' * len(opponents))})"
+        params = teams + opponents
+    try:
+        games = read_sql(query, params)
+    except Exception:
+        return pd.DataFrame()
+    if not games.empty:
+        games['game_date'] = pd.to_datetime(games['game_date'])
+    return games
+
+def get_team_players(team):
+    """Totales de temporada (sumas y GP) de los jugadores que han jugado en `team`."""
+    _ensure_aggregates()
+    try:
+        return read_sql('SELECT * FROM team_player WHERE team_abbreviation = ? ORDER BY player_name', [team])
+    except Exception:
+        return pd.DataFrame()
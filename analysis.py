@@ -0,0 +1,471 @@
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import pandas as pd
+from db import DB_PATH, read_sql, get_write_connection
+from aggregates import get_team_games
+
+# Motor de bajas (DNP): presencia equipo-fecha × jugador con joins, sin recorrer fila a fila
+KEY_PLAYER_MIN_MINUTES = 12.0
+
+def select_key_players(logs, teams=None, min_minutes=KEY_PLAYER_MIN_MINUTES):
+    """Jugadores (nombre, equipo) con más de `min_minutes` de media, opcionalmente de ciertos equipos."""
+    if logs.empty:
+        return pd.DataFrame(columns=['player_name', 'team_abbreviation', 'min'])
+    means = logs.groupby(['player_name', 'team_abbreviation'], observed=True)['min'].mean().reset_index()
+    key = means[means['min'] > min_minutes]
+    if teams is not None:
+        key = key[key['team_abbreviation'].isin(teams)]
+    return key.reset_index(drop=True)
+
+def detect_absences(logs, key_players, dates=None):
+    """
+    Bajas de jugadores clave: su equipo jugó esa fecha y ellos no aparecen en ningún box score.
+    Sirve para cualquier número de fechas y equipos (p. ej. temporadas completas).
+    Devuelve (game_date, team_abbreviation, player_name), en el orden de `key_players`.
+    """
+    cols = ['game_date', 'team_abbreviation', 'player_name']
+    if logs.empty or key_players.empty:
+        return pd.DataFrame(columns=cols)
+    if dates is not None:
+        logs = logs[logs['game_date'].isin(dates)]
+
+    team_str = logs['team_abbreviation'].astype(str)
+    team_dates = pd.DataFrame({'game_date': logs['game_date'], 'team_abbreviation': team_str}).drop_duplicates()
+    present = pd.DataFrame({'game_date': logs['game_date'], 'player_name': logs['player_name'].astype(str)}).drop_duplicates()
+    roster = pd.DataFrame({
+        'player_name': key_players['player_name'].astype(str),
+        'team_abbreviation': key_players['team_abbreviation'].astype(str)
+    })
+
+    # Esperados: cada jugador clave en cada fecha en la que jugó su equipo
+    expected = team_dates.merge(roster, on='team_abbreviation')
+    merged = expected.merge(present, on=['game_date', 'player_name'], how='left', indicator=True)
+    return merged.loc[merged['_merge'] == 'left_only', cols].reset_index(drop=True)
+
+def absences_by_date(absences):
+    """Tabla fecha × equipo con los nombres de las bajas unidos por comas."""
+    if absences.empty:
+        return pd.DataFrame()
+    return absences.groupby(['game_date', 'team_abbreviation'], sort=False)['player_name'].agg(', '.join).unstack()
+
+# Impacto de bajas de estrellas ("Patrones"): tabla de toda la liga calculada al sincronizar
+STAR_THRESHOLDS = {'pts': 18, 'reb': 7, 'ast': 5}
+IMPACT_RULES = {'pts': (15, 8), 'reb': (7, 4), 'ast': (5, 4)}  # (mínimo del partido, mínimo sobre su media)
+IMPACT_STATS = list(STAR_THRESHOLDS)
+
+_impact_state = {'checked': False}
+
+def build_absence_impact(logs, means, current_team):
+    """
+    Para cada partido de cada equipo: estrellas ausentes (equipo actual = ese equipo y sin box
+    score ese día) y compañeros que superaron su media con margen en la estadística de la estrella.
+    - means: medias pts/reb/ast indexadas por jugador
+    - current_team: equipo actual de cada jugador
+    Devuelve una fila por compañero con impacto.
+    """
+    cols = ['game_date', 'team_abbreviation', 'player_name', 'missing_stars'] + IMPACT_STATS + \
+           [f'diff_{s}' for s in IMPACT_STATS] + [f'impact_{s}' for s in IMPACT_STATS]
+    if logs.empty or means.empty:
+        return pd.DataFrame(columns=cols)
+
+    means = means[IMPACT_STATS].astype('float64')
+    means.index = means.index.astype(str)
+    current_team = pd.Series(current_team).astype(str)
+    current_team.index = current_team.index.astype(str)
+
+    star_flags = pd.DataFrame({s: means[s] > t for s, t in STAR_THRESHOLDS.items()})
+    stars = star_flags[star_flags.any(axis=1)].sort_index()
+    stars = stars.assign(team_abbreviation=current_team.reindex(stars.index)).dropna(subset=['team_abbreviation'])
+    stars = stars.rename_axis('player_name').reset_index()
+
+    missing = detect_absences(logs, stars[['player_name', 'team_abbreviation']])
+    if missing.empty:
+        return pd.DataFrame(columns=cols)
+    missing = missing.merge(stars, on=['player_name', 'team_abbreviation'])
+    by_game = missing.groupby(['game_date', 'team_abbreviation'], sort=False).agg(
+        missing_stars=('player_name', ', '.join),
+        **{f'star_{s}': (s, 'any') for s in IMPACT_STATS}
+    ).reset_index()
+
+    # Compañeros que jugaron ese partido y siguen en el equipo
+    mates = pd.DataFrame({
+        'game_date': logs['game_date'],
+        'team_abbreviation': logs['team_abbreviation'].astype(str),
+        'player_name': logs['player_name'].astype(str),
+        **{s: logs[s].astype('float64') for s in IMPACT_STATS}
+    })
+    mates = mates[mates['player_name'].map(current_team) == mates['team_abbreviation']]
+    mates = mates.merge(by_game, on=['game_date', 'team_abbreviation'])
+    mates = mates[mates['player_name'].isin(means.index)]
+
+    avg = means.reindex(mates['player_name']).to_numpy()
+    impact_any = pd.Series(False, index=mates.index)
+    for i, s in enumerate(IMPACT_STATS):
+        min_value, min_diff = IMPACT_RULES[s]
+        mates[f'diff_{s}'] = mates[s] - avg[:, i]
+        mates[f'impact_{s}'] = mates[f'star_{s}'] & (mates[s] >= min_value) & (mates[f'diff_{s}'] >= min_diff)
+        impact_any |= mates[f'impact_{s}']
+    return mates.loc[impact_any, cols].reset_index(drop=True)
+
+def refresh_absence_impact(conn):
+    """Recalcula la tabla `absence_impact` de toda la liga desde `player` y `player_agg`."""
+    try:
+        logs = pd.read_sql_query(
+            'SELECT game_date, team_abbreviation, player_name, pts, reb, ast FROM player', conn)
+        agg = pd.read_sql_query(
+            'SELECT player_name, team_abbreviation, pts, reb, ast FROM player_agg', conn).set_index('player_name')
+    except Exception:
+        return
+    logs['game_date'] = pd.to_datetime(logs['game_date']).dt.strftime('%Y-%m-%d')
+    impact = build_absence_impact(logs, agg[IMPACT_STATS], agg['team_abbreviation'])
+    conn.execute('DROP TABLE IF EXISTS absence_impact;')
+    impact.to_sql('absence_impact', conn, index=False)
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_impact_team_date ON absence_impact(team_abbreviation, game_date);')
+    conn.commit()
+
+def _ensure_absence_impact():
+    if _impact_state['checked'] or not os.path.exists(DB_PATH):
+        return
+    try:
+        read_sql('SELECT 1 FROM absence_impact LIMIT 1')
+    except Exception:
+        conn = get_write_connection()
+        try:
+            refresh_absence_impact(conn)
+        finally:
+            conn.close()
+    _impact_state['checked'] = True
+
+def get_absence_impact(teams, dates=None):
+    """Filas de impacto de unos equipos (y fechas), de la más reciente a la más antigua."""
+    _ensure_absence_impact()
+    teams = list(teams)
+    query = f"SELECT * FROM absence_impact WHERE team_abbreviation IN ({', '.join('?' * len(teams))})"
+    params = teams
+    if dates is not None:
+        dates = [pd.Timestamp(d).strftime('%Y-%m-%d') for d in dates]
+        query += f" AND game_date IN ({', '.join('?' * len(dates))})"
+        params = teams + dates
+    try:
+        impact = read_sql(query + " ORDER BY game_date DESC, team_abbreviation, pts DESC", params)
+    except Exception:
+        return pd.DataFrame()
+    if not impact.empty:
+        impact['game_date'] = pd.to_datetime(impact['game_date'])
+    return impact
+
+# Generador de piernas de parlay: distribución por jugador y mercado en una sola pasada agrupada
+LEG_MARKETS = {
+    'PTS': ['pts'], 'REB': ['reb'], 'AST': ['ast'], '3PM': ['fg3m'],
+    'PRA': ['pts', 'reb', 'ast'], 'P+R': ['pts', 'reb'], 'P+A': ['pts', 'ast'], 'R+A': ['reb', 'ast']
+}
+SAFE_LINES = {'PTS': 10, 'REB': 5, 'AST': 3}   # suelo mínimo para la pierna conservadora
+RISKY_LINES = {'PTS': 15, 'REB': 7, 'AST': 5}  # media mínima para la arriesgada
+LEG_KEYS = ['player_name', 'team_abbreviation']
+
+def leg_distributions(logs, markets=None, quantiles=()):
+    """
+    Una fila por (jugador, equipo, mercado) con partidos, media, suelo (2º valor más bajo)
+    y los cuantiles pedidos (columnas q10, q25...). `markets` admite combinaciones (PRA, P+R...).
+    Vale para un partido o para todos los equipos de la jornada a la vez.
+    """
+    markets = markets or LEG_MARKETS
+    markets = {m: cols for m, cols in markets.items() if all(c in logs.columns for c in cols)}
+    if logs.empty or not markets:
+        return pd.DataFrame(columns=LEG_KEYS + ['market', 'gp', 'avg', 'floor'])
+
+    keys = logs[LEG_KEYS].astype(str).reset_index(drop=True)
+    values = pd.DataFrame({m: logs[cols].astype('float64').sum(axis=1).to_numpy() for m, cols in markets.items()})
+    long = pd.concat([keys, values], axis=1).melt(id_vars=LEG_KEYS, var_name='market', value_name='value')
+
+    group_cols = LEG_KEYS + ['market']
+    g = long.groupby(group_cols, observed=True)['value']
+    dist = g.agg(gp='size', avg='mean')
+    rank = g.rank(method='first')
+    dist['floor'] = long[rank == 2].set_index(group_cols)['value']
+    for q in quantiles:
+        dist[f'q{int(round(q * 100))}'] = g.quantile(q)
+    return dist.reset_index()
+
+def _leg_records(rows, value_col):
+    return [{'player': p, 'val': int(v), 'avg': a, 'type': m}
+            for p, v, a, m in zip(rows['player_name'], rows[value_col], rows['avg'], rows['market'])]
+
+def pick_parlay_legs(dist, candidates=None, min_games=1, safe_lines=SAFE_LINES, risky_lines=RISKY_LINES, top_n=3):
+    """
+    Piernas conservadoras (suelo >= línea) y arriesgadas (media >= línea), las `top_n` de mayor
+    media por mercado y en el orden de las líneas. `candidates` limita los (jugador, equipo).
+    """
+    if dist.empty:
+        return {'safe': [], 'risky': []}
+    if candidates is not None:
+        dist = dist.merge(candidates[LEG_KEYS].astype(str).drop_duplicates(), on=LEG_KEYS)
+    dist = dist[dist['gp'] >= min_games].sort_values('avg', ascending=False, kind='stable')
+
+    def _pick(lines, value_col):
+        legs = []
+        for market, line in lines.items():
+            rows = dist[(dist['market'] == market) & (dist[value_col] >= line)].head(top_n)
+            legs += _leg_records(rows, value_col)
+        return legs
+
+    return {'safe': _pick(safe_lines, 'floor'), 'risky': _pick(risky_lines, 'avg')}
+
+# Análisis completo de un cruce (lo que pinta "⚔️ Analizar Partido"), sin dependencias de Streamlit
+H2H_GAMES = 5
+
+TREND_STATS = ['pts', 'reb', 'ast', 'min', 'fg3m']
+
+def build_trend_pivot(recent, dates, stats=TREND_STATS):
+    """Un solo pivot (jugador, equipo) × (estadística, fecha), con las fechas en el orden de `dates`."""
+    stats = [c for c in stats if c in recent.columns]
+    pivot = recent.pivot_table(
+        index=['player_name', 'team_abbreviation'], columns='date_str',
+        values=stats, aggfunc='sum', observed=True
+    )
+    return pivot.reindex(columns=pd.MultiIndex.from_product([stats, dates]))
+
+def format_trends(pivot, missing, sep, zero_is_missing=False):
+    """Texto por fila y estadística: valores enteros unidos por `sep` y `missing` en los huecos."""
+    out = {}
+    for stat in pivot.columns.unique(level=0):
+        block = pivot[stat]
+        empty = block.isna() | (block == 0) if zero_is_missing else block.isna()
+        text = block.fillna(0).astype('int64').astype(str).mask(empty, missing)
+        joined = text.iloc[:, 0]
+        for col in text.columns[1:]:
+            joined = joined + sep + text[col]
+        out[stat] = joined
+    return pd.DataFrame(out, index=pivot.index)
+
+COMPARATIVE_METRICS = [('pts', 'PTS'), ('reb', 'REB'), ('ast', 'AST'), ('fg_pct', 'FG%'),
+                       ('fg3m', '3PM'), ('tov', 'TOV'), ('pace', 'PACE')]
+
+def build_comparative(team_games, t1, t2, metrics=COMPARATIVE_METRICS):
+    """
+    Tabla FECHA × (métrica, equipo) de los cruces entre `t1` y `t2`, del más reciente al más antiguo.
+    Los huecos (un equipo sin filas ese día) se muestran como 0.
+    """
+    if team_games.empty:
+        return pd.DataFrame()
+    games = team_games[
+        ((team_games['team_abbreviation'] == t1) & (team_games['opponent_abbreviation'] == t2)) |
+        ((team_games['team_abbreviation'] == t2) & (team_games['opponent_abbreviation'] == t1))
+    ]
+    metrics = [(col, label) for col, label in metrics if col in games.columns]
+    if games.empty or not metrics:
+        return pd.DataFrame()
+
+    wide = games.pivot_table(index='game_date', columns='team_abbreviation',
+                             values=[col for col, _ in metrics], aggfunc='sum')
+    wide = wide.reindex(columns=pd.MultiIndex.from_product([[col for col, _ in metrics], [t1, t2]]), fill_value=0)
+    wide = wide.fillna(0).sort_index(ascending=False)
+
+    out = pd.DataFrame({'FECHA': wide.index.strftime('%d/%m')})
+    for col, label in metrics:
+        for team in (t1, t2):
+            values = wide[(col, team)].to_numpy()
+            if col == 'fg_pct':
+                out[f'{team} {label}'] = [f"{v * 100:.1f}" for v in values]
+            elif col == 'pace':
+                out[f'{team} {label}'] = [f"{v:.1f}" for v in values]
+            else:
+                out[f'{team} {label}'] = values.astype('int64')
+    return out
+
+def _empty_bundle(t1, t2):
+    """Paquete de un cruce sin partidos entre ambos equipos: mismas claves y columnas, sin filas."""
+    trend_cols = [f'trend_{s}' for s in ('pts', 'reb', 'ast', 'min')]
+    return {
+        't1': t1, 't2': t2,
+        'games_summary': [], 'comparative': pd.DataFrame(),
+        'target_dates_str': [],
+        'stats': pd.DataFrame(columns=['player_name', 'team_abbreviation', 'pts', 'reb', 'ast', 'gp'] + trend_cols),
+        'card_trends': pd.DataFrame(),
+        'card_index': pd.DataFrame(columns=['avg_2pt', 'avg_3pt', 'avg_ft', 'avg_3pm']),
+        'dnp': None, 'patterns': [], 'legs': {'safe': [], 'risky': []}
+    }
+
+def analyze_matchup(logs, t1, t2, latest_teams_map, impact=None, team_games=None):
+    """
+    Calcula el paquete de datos del análisis de `t1` (local) contra `t2` (visitante):
+    historial H2H, resumen y comparativa por partido, medias y tendencias por jugador,
+    bajas, patrones y piernas de parlay. `impact` y `team_games` son las tablas de impacto
+    de bajas y de box scores de equipo (si no se pasan, se consultan en SQLite).
+    """
+    mask = ((logs['team_abbreviation'] == t1) & (logs['opponent_abbreviation'] == t2)) | \
+        ((logs['team_abbreviation'] == t2) & (logs['opponent_abbreviation'] == t1))
+    history = logs[mask].sort_values('game_date', ascending=False)
+    if history.empty:
+        return _empty_bundle(t1, t2)
+    last_dates = sorted(history['game_date'].unique(), reverse=True)[:H2H_GAMES]
+
+    # Resumen H2H: resultado visto desde t1 (o desde t2 si t1 no tiene filas ese día)
+    games_summary = []
+    for date in last_dates:
+        day_data = history[history['game_date'] == date]
+        if day_data.empty:
+            continue
+        row_t1 = day_data[day_data['team_abbreviation'] == t1]
+        if not row_t1.empty:
+            wl_t1 = row_t1.iloc[0]['wl']
+            icon1 = '✅' if wl_t1 == 'W' else '❌'
+            icon2 = '❌' if wl_t1 == 'W' else '✅'
+        else:
+            row_t2 = day_data[day_data['team_abbreviation'] == t2]
+            if not row_t2.empty:
+                wl_t2 = row_t2.iloc[0]['wl']
+                icon2 = '✅' if wl_t2 == 'W' else '❌'
+                icon1 = '❌' if wl_t2 == 'W' else '✅'
+            else:
+                icon1, icon2 = '', ''
+        g_id = day_data.iloc[0].get('game_id')
+        link = f"<a href='https://www.nba.com/game/{g_id}' target='_blank' class='match-link'>📊</a>" if pd.notnull(g_id) else "-"
+        games_summary.append({'FECHA': date.strftime('%d/%m'), 'ENFRENTAMIENTO': f"{t1} {icon1} vs {t2} {icon2}", 'FICHA': link})
+
+    # Comparativa por partido: un pivot de la tabla de box scores de equipo
+    if team_games is None:
+        team_games = get_team_games([t1, t2], opponents=[t1, t2])
+    comparative = build_comparative(team_games, t1, t2)
+
+    # Medias y tendencias de los últimos cruces
+    recent_players = history[history['game_date'].isin(last_dates)].sort_values('game_date', ascending=False)
+    target_dates_str = [d.strftime('%Y-%m-%d') for d in last_dates]
+    recent_players = recent_players.assign(date_str=recent_players['game_date'].dt.strftime('%Y-%m-%d'))
+
+    base_stats = recent_players.groupby(['player_name', 'team_abbreviation'], observed=True).agg(
+        pts=('pts', 'mean'),
+        reb=('reb', 'mean'),
+        ast=('ast', 'mean'),
+        gp=('game_date', 'count')
+    )
+    # Un único pivot para las tendencias de la tabla ("❌" si no jugó o hizo 0) y las series
+    # de las tarjetas (por jugador, "X" si no jugó)
+    pivot = build_trend_pivot(recent_players, target_dates_str)
+    trends = format_trends(pivot[['pts', 'reb', 'ast', 'min']], "❌", "/", zero_is_missing=True).add_prefix('trend_')
+    card_trends = format_trends(pivot.groupby(level='player_name', observed=True).sum(min_count=1), "X", " • ")
+    stats = base_stats.join(trends).reset_index()
+
+    # Índice por jugador para las tarjetas: medias de sus últimos 5 cruces (history va de reciente a antiguo)
+    last5 = history.groupby('player_name', observed=True, sort=False).head(5)
+    means5 = last5.groupby('player_name', observed=True)[['fgm', 'fg3m', 'ftm']].mean()
+    card_index = pd.DataFrame({
+        'avg_2pt': (means5['fgm'] - means5['fg3m']) * 2,
+        'avg_3pt': means5['fg3m'] * 3,
+        'avg_ft': means5['ftm'],
+        'avg_3pm': means5['fg3m']
+    })
+    stats = stats[stats['player_name'].apply(lambda x: latest_teams_map.get(x) in [t1, t2])]
+
+    # Bajas de jugadores clave en los últimos cruces
+    dnp = None
+    key_players = select_key_players(recent_players, teams=[t1, t2])
+    if not key_players.empty:
+        dnp_dates = last_dates[:5]
+        missing = absences_by_date(detect_absences(recent_players, key_players, dates=dnp_dates))
+        missing = missing.reindex(index=dnp_dates, columns=[t1, t2])
+
+        def _dnp_cell(names):
+            return f"<span class='dnp-missing'>{names}</span>" if pd.notna(names) else "<span class='dnp-full'>✓ Todos disponibles</span>"
+
+        dnp = [{
+            'FECHA': date.strftime('%d/%m'),
+            f'BAJAS {t1}': _dnp_cell(missing.at[date, t1]),
+            f'BAJAS {t2}': _dnp_cell(missing.at[date, t2])
+        } for date in dnp_dates]
+
+    # Patrones: filtro de la tabla de impacto de toda la liga
+    if impact is None:
+        impact = get_absence_impact([t1, t2], dates=last_dates)
+    elif not impact.empty:
+        impact = impact[impact['team_abbreviation'].isin([t1, t2]) & impact['game_date'].isin(last_dates)]
+    impact_icons = {'pts': '🏀', 'reb': '🖐', 'ast': '🎁'}
+    patterns = []
+    if not impact.empty:
+        msg = "<b>" + impact['player_name'] + "</b> (" + impact.apply(
+            lambda r: ", ".join(f"{icon}+{int(r[f'diff_{s}'])}" for s, icon in impact_icons.items() if r[f'impact_{s}']),
+            axis=1
+        ) + ")"
+        for (date, team, missing_str), grp in msg.groupby([impact['game_date'], impact['team_abbreviation'], impact['missing_stars']], sort=False):
+            patterns.append({'FECHA': date.strftime('%d/%m'), 'EQUIPO': team, 'FALTA': f"<span class='pat-stars'>{missing_str}</span>", 'IMPACTO': f"<span class='pat-impact'>{'<br>'.join(grp)}</span>"})
+
+    # Piernas de parlay
+    min_games_needed = max(3, int(len(last_dates) * 0.6))
+    legs = pick_parlay_legs(
+        leg_distributions(recent_players, markets={m: LEG_MARKETS[m] for m in ('PTS', 'REB', 'AST')}),
+        candidates=stats,
+        min_games=min_games_needed
+    )
+
+    return {
+        't1': t1, 't2': t2,
+        'games_summary': games_summary, 'comparative': comparative,
+        'target_dates_str': target_dates_str,
+        'stats': stats, 'card_trends': card_trends, 'card_index': card_index,
+        'dnp': dnp, 'patterns': patterns, 'legs': legs
+    }
+
+# Análisis de la jornada completa: un proceso por partido y caché en disco por (game_id, versión de datos)
+ANALYSIS_CACHE_DIR = "analysis_cache"
+SLATE_MAX_WORKERS = 4
+ANALYSIS_FORMAT = 6  # subir al cambiar el contenido del paquete para invalidar la caché
+
+def _analysis_cache_suffix(version):
+    return f"_{version}_{ANALYSIS_FORMAT}.pkl"
+
+def _analysis_cache_path(game_id, version):
+    return os.path.join(ANALYSIS_CACHE_DIR, f"{game_id}{_analysis_cache_suffix(version)}")
+
+def load_cached_analysis(game_id, version):
+    """Paquete de análisis guardado para ese partido y esa versión de los datos (o None)."""
+    try:
+        return pd.read_pickle(_analysis_cache_path(game_id, version))
+    except Exception:
+        return None
+
+def save_cached_analysis(game_id, version, bundle):
+    """Guarda el paquete y borra los de versiones de datos anteriores."""
+    try:
+        os.makedirs(ANALYSIS_CACHE_DIR, exist_ok=True)
+        suffix = _analysis_cache_suffix(version)
+        for name in os.listdir(ANALYSIS_CACHE_DIR):
+            if not name.endswith(suffix):
+                os.remove(os.path.join(ANALYSIS_CACHE_DIR, name))
+        path = _analysis_cache_path(game_id, version)
+        pd.to_pickle(bundle, path + ".tmp")
+        os.replace(path + ".tmp", path)
+    except Exception as e:
+        print(f"Error guardando análisis {game_id}: {e}")
+
+def analyze_slate(agenda, logs, latest_teams_map, version, max_workers=SLATE_MAX_WORKERS):
+    """
+    Analiza todos los partidos de la agenda de obtener_partidos() en un pool de procesos
+    y deja cada paquete en la caché de disco. Devuelve el número de partidos analizados.
+    """
+    games = [g for day in agenda.values() for g in day
+             if g.get('h_abv') and g.get('v_abv') and load_cached_analysis(g['game_id'], version) is None]
+    if not games:
+        return 0
+
+    teams = sorted({g['h_abv'] for g in games} | {g['v_abv'] for g in games})
+    impact = get_absence_impact(teams)
+    team_games = get_team_games(teams, opponents=teams)
+    done = 0
+    # spawn: los procesos no heredan hilos ni conexiones SQLite del servidor de Streamlit
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+        futures = {}
+        for g in games:
+            t1, t2 = g['h_abv'], g['v_abv']
+            game_logs = logs[logs['team_abbreviation'].isin([t1, t2])]
+            game_impact = impact[impact['team_abbreviation'].isin([t1, t2])] if not impact.empty else impact
+            game_team_games = team_games[team_games['team_abbreviation'].isin([t1, t2])] if not team_games.empty else team_games
+            futures[executor.submit(analyze_matchup, game_logs, t1, t2, latest_teams_map,
+                                    game_impact, game_team_games)] = g['game_id']
+        for future in as_completed(futures):
+            try:
+                save_cached_analysis(futures[future], version, future.result())
+                done += 1
+            except Exception as e:
+                print(f"Error analizando partido {futures[future]}: {e}")
+    return done
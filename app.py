@@ -14,8 +14,11 @@ def html_clean(s: str) -> str:
     return "\n".join([ln.lstrip() for ln in s.splitlines()])
 
 # Importar módulos propios
-from data import load_data, download_data, get_team_roster_numbers, get_next_matchup_info, query_player_stats, get_injuries
-from odds import get_sports_odds, save_cache, load_cache, detect_value_odds
+from data import load_data, clear_caches, download_data, seconds_since_last_sync, fetch_matchup_context, prefetch_league_rosters, query_player_stats, data_version
+from analysis import analyze_matchup, analyze_slate, load_cached_analysis, save_cached_analysis
+from aggregates import (load_player_aggregates, load_latest_teams, get_player_aggregates, get_opponent_split,
+                        build_player_aggregates, get_team_games, get_team_players)
+from odds import BOARD_MARKETS, refresh_odds, get_quota, latest_snapshot_info, load_odds_table, detect_value_odds
 from ui import mostrar_leyenda_colores, mostrar_tabla_bonita, render_clickable_player_table, render_clickable_player_cards
 from utils import convertir_hora_espanol, get_basketball_date, safe_request
 
@@ -178,10 +181,13 @@ if 'odds_api_key' not in st.session_state:
     st.session_state.odds_api_key = API_KEY_DEFAULT
 if 'selected_parlay_legs' not in st.session_state:
     st.session_state.selected_parlay_legs = []
+if 'selected_game_id' not in st.session_state:
+    st.session_state.selected_game_id = None
 
-def navegar_a_partido(home, visitor):
+def navegar_a_partido(home, visitor, game_id=None):
     st.session_state.selected_home = home
     st.session_state.selected_visitor = visitor
+    st.session_state.selected_game_id = game_id
     st.session_state.page = "⚔️ Analizar Partido"
 
 def navegar_a_jugador(player_name):
@@ -197,19 +203,46 @@ def volver_a_partido():
 # ==========================================
 # 4. CARGA DE DATOS (CON ACTUALIZACIÓN AUTOMÁTICA)
 # ==========================================
-df = load_data()
+AUTO_SYNC_COOLDOWN = 3600  # segundos entre comprobaciones automáticas
+
+# Columnas que usan las páginas sobre el DataFrame global (el resto se consulta por jugador en SQLite)
+APP_COLUMNS = ['player_name', 'team_abbreviation', 'opponent_abbreviation', 'is_home', 'game_date', 'matchup', 'wl', 'game_id',
+               'pts', 'reb', 'ast', 'fg3m', 'fgm', 'ftm', 'min']
+# Columnas que la página de jugador pide a SQLite
+PLAYER_PAGE_COLUMNS = ['game_date', 'game_id', 'matchup', 'wl', 'team_abbreviation', 'opponent_abbreviation',
+                       'min', 'pts', 'reb', 'ast', 'fg3m', 'fgm', 'ftm']
+
+df = load_data(columns=APP_COLUMNS)
 if not df.empty:
     last_date = df['game_date'].max()
     if last_date.date() < datetime.now().date() - timedelta(days=1):
-        with st.spinner("Actualizando datos automáticamente..."):
-            if download_data():
-                st.cache_data.clear()
-                st.rerun()
+        last_sync = seconds_since_last_sync()
+        if last_sync is None or last_sync > AUTO_SYNC_COOLDOWN:
+            with st.spinner("Actualizando datos automáticamente..."):
+                # Solo pide los partidos posteriores a la última sincronización
+                if download_data(incremental=True):
+                    clear_caches()
+                    st.rerun()
 
-latest_teams_map = {}
-if not df.empty:
-    latest_entries = df.sort_values('game_date').drop_duplicates('player_name', keep='last')
-    latest_teams_map = dict(zip(latest_entries['player_name'], latest_entries['team_abbreviation']))
+# Dorsales de toda la liga: se refrescan en segundo plano como mucho una vez al día
+prefetch_league_rosters()
+
+latest_teams_map = load_latest_teams() if not df.empty else {}
+
+@st.cache_data(show_spinner=False)
+def _analizar_cruce(t1, t2, version):
+    return analyze_matchup(df[df['team_abbreviation'].isin([t1, t2])], t1, t2, latest_teams_map)
+
+def obtener_analisis(t1, t2):
+    """Análisis del cruce: el precalculado de la jornada (por game_id) o calculado al momento."""
+    version = data_version()
+    game_id = st.session_state.selected_game_id
+    bundle = load_cached_analysis(game_id, version) if game_id else None
+    if bundle is None or (bundle['t1'], bundle['t2']) != (t1, t2):
+        bundle = _analizar_cruce(t1, t2, version)
+        if game_id:
+            save_cached_analysis(game_id, version, bundle)
+    return bundle
 
 # ==========================================
 # 5. MENÚ PRINCIPAL
@@ -263,7 +296,7 @@ if st.session_state.page == "🏠 Inicio":
 
                 unique_key = f"btn_{title}_{g['game_id']}_{i}"
                 if st.button(f"🔍 ANALIZAR {g['v_abv']} vs {g['h_abv']}", key=unique_key):
-                    navegar_a_partido(g['h_abv'], g['v_abv'])
+                    navegar_a_partido(g['h_abv'], g['v_abv'], g['game_id'])
                     st.rerun()
 
                 st.write("")
@@ -271,6 +304,12 @@ if st.session_state.page == "🏠 Inicio":
     render_block(c1, titulo_col1, agenda.get(titulo_col1, []), "#4caf50")
     render_block(c2, titulo_col2, agenda.get(titulo_col2, []), "#2196f3")
 
+    if agenda and not df.empty:
+        if st.button("⚡ Precalcular análisis de toda la jornada"):
+            with st.spinner("Analizando todos los partidos..."):
+                n = analyze_slate(agenda, df, latest_teams_map, data_version())
+            st.success(f"Análisis listos ({n} nuevos).")
+
     st.markdown("<div class='credits'>Creado por ad.ri.</div>", unsafe_allow_html=True)
 
 # --- PÁGINA ACTUALIZAR DATOS ---
@@ -279,14 +318,20 @@ elif st.session_state.page == "🔄 Actualizar Datos":
     st.caption("Selecciona las temporadas que quieres incluir en la base de datos.")
     temporadas_disponibles = ['2023-24', '2024-25', '2025-26']
     seleccionadas = st.multiselect("Temporadas", temporadas_disponibles, default=['2024-25', '2025-26'])
+    incremental = st.checkbox("Solo partidos nuevos (sincronización incremental)", value=True,
+                              help="Desmárcalo para volver a descargar las temporadas completas.")
 
     if st.button("Descargar y Actualizar Ahora"):
+        progress_bar = st.progress(0)
         with st.spinner("Conectando con servidores NBA..."):
-            success = download_data(seasons=seleccionadas)
+            success = download_data(seasons=seleccionadas, incremental=incremental,
+                                    progress_callback=progress_bar.progress)
             if success:
                 st.success("¡Datos actualizados con Triples!")
-                st.cache_data.clear()
+                clear_caches()
                 st.rerun()
+            elif incremental:
+                st.info("No hay partidos nuevos desde la última sincronización.")
 
 # --- PÁGINA JUGADOR ---
 elif st.session_state.page == "👤 Jugador":
@@ -314,30 +359,23 @@ elif st.session_state.page == "👤 Jugador":
             st.session_state.selected_player = jugador
 
         if jugador:
-            player_data = query_player_stats(player_name=jugador).sort_values('game_date', ascending=False)
+            player_data = query_player_stats(player_name=jugador, columns=PLAYER_PAGE_COLUMNS).sort_values('game_date', ascending=False)
 
             rival = st.selectbox("Filtrar vs Rival (Opcional):", todos_equipos, index=None)
 
-            mean_pts = player_data['pts'].mean()
-            mean_reb = player_data['reb'].mean()
-            mean_ast = player_data['ast'].mean()
-            mean_3pm = player_data['fg3m'].mean()
-            mean_min = player_data['min'].mean()
+            # Medias y desglose 2PT/3PT/TL precalculados al sincronizar (una sola fila)
+            agg = get_player_aggregates(jugador)
+            if agg is None:
+                agg = build_player_aggregates(player_data.assign(player_name=jugador)).iloc[0]
 
-            means_dict = {'PTS': mean_pts, 'REB': mean_reb, 'AST': mean_ast, '3PM': mean_3pm, 'MIN': mean_min}
+            mean_pts = agg['pts']
+            mean_reb = agg['reb']
+            mean_ast = agg['ast']
+            mean_3pm = agg['fg3m']
+            mean_min = agg['min']
 
-            # Desglose de puntos: 2PT / 3PT / TL
-            # - Preferimos calcularlo con FGM/FG3M/FTM si existen
-            # - Si no, lo calculamos desde PTS - (FG3M*3) - FTM (si FTM existe)
-            mean_pts_2 = mean_pts_3 = mean_pts_ft = None
-            if 'fg3m' in player_data.columns and 'pts' in player_data.columns:
-                pts_3 = (player_data['fg3m'] * 3).mean()
-                pts_ft = (player_data['ftm']).mean() if 'ftm' in player_data.columns else 0.0
-                if 'fgm' in player_data.columns:
-                    pts_2 = ((player_data['fgm'] - player_data['fg3m']) * 2).mean()
-                else:
-                    pts_2 = (player_data['pts'] - (player_data['fg3m'] * 3) - (player_data['ftm'] if 'ftm' in player_data.columns else 0)).mean()
-                mean_pts_2, mean_pts_3, mean_pts_ft = float(pts_2), float(pts_3), float(pts_ft)
+            means_dict = {'PTS': mean_pts, 'REB': mean_reb, 'AST': mean_ast, '3PM': mean_3pm, 'MIN': mean_min}
+            mean_pts_2, mean_pts_3, mean_pts_ft = float(agg['pts_2']), float(agg['pts_3']), float(agg['pts_ft'])
 
             # ===== PERFIL ESTILO TARJETAS (más estético, como la imagen) =====
             latest_row = player_data.iloc[0] if not player_data.empty else None
@@ -454,6 +492,18 @@ elif st.session_state.page == "👤 Jugador":
             c3.metric("AST", f"{mean_ast:.1f}")
             c4.metric("3PM", f"{mean_3pm:.1f}")
             c5.metric("MIN", f"{mean_min:.1f}")
+            st.caption(
+                f"Últimos 5: {agg['last5_pts']:.1f} PTS • {agg['last5_reb']:.1f} REB • {agg['last5_ast']:.1f} AST  |  "
+                f"Últimos 10: {agg['last10_pts']:.1f} PTS • {agg['last10_reb']:.1f} REB • {agg['last10_ast']:.1f} AST  |  "
+                f"Suelo: {agg['floor_pts']:.0f} PTS • {agg['floor_reb']:.0f} REB • {agg['floor_ast']:.0f} AST"
+            )
+            if rival:
+                split = get_opponent_split(jugador, rival)
+                if split is not None:
+                    st.caption(
+                        f"Vs {rival} ({int(split['gp'])} PJ): {split['pts']:.1f} PTS • {split['reb']:.1f} REB • "
+                        f"{split['ast']:.1f} AST • {split['fg3m']:.1f} 3PM"
+                    )
 
             # GRÁFICO (BARRAS) – sin ajustes / sin edición
             st.subheader("📊 Últimos partidos (gráfico de barras)")
@@ -470,7 +520,7 @@ elif st.session_state.page == "👤 Jugador":
             metric_col = _metric_col(metrica)
 
             # Global: últimos 10 partidos
-            base_series = player_data.sort_values('game_date').tail(10).copy()
+            base_series = player_data.sort_values('game_date').tail(10)
             base_series['FECHA'] = base_series['game_date'].dt.strftime('%d/%m')
 
             fig_global = px.bar(
@@ -491,7 +541,7 @@ elif st.session_state.page == "👤 Jugador":
             # Vs rival: últimos 10 contra ese equipo (si existe)
             fig_vs = None
             if rival:
-                vs_team = player_data[player_data['matchup'].str.contains(rival, case=False)].sort_values('game_date').tail(10).copy()
+                vs_team = player_data[player_data['opponent_abbreviation'] == rival].sort_values('game_date').tail(10)
                 if not vs_team.empty:
                     vs_team['FECHA'] = vs_team['game_date'].dt.strftime('%d/%m')
                     fig_vs = px.bar(
@@ -529,7 +579,7 @@ elif st.session_state.page == "👤 Jugador":
             cols = ['game_date', 'wl', 'matchup', 'min', 'pts', 'reb', 'ast', 'fg3m']
             if 'game_id' in player_data.columns:
                 cols.append('game_id')
-            view = player_data[cols].head(5).copy()
+            view = player_data[cols].head(5)
             view['min'] = view['min'].astype(int)
             view['RES'] = view['wl'].map({'W': '✅', 'L': '❌'})
 
@@ -550,9 +600,9 @@ elif st.session_state.page == "👤 Jugador":
 
             if rival:
                 st.subheader(f"Historial vs {rival}")
-                h2h = player_data[player_data['matchup'].str.contains(rival, case=False)]
+                h2h = player_data[player_data['opponent_abbreviation'] == rival]
                 if not h2h.empty:
-                    view_h2h = h2h[cols].copy()
+                    view_h2h = h2h[cols]
                     view_h2h['min'] = view_h2h['min'].astype(int)
                     view_h2h['RES'] = view_h2h['wl'].map({'W': '✅', 'L': '❌'})
                     if 'game_id' in view_h2h.columns:
@@ -573,7 +623,7 @@ elif st.session_state.page == "👤 Jugador":
 
             if otro_jugador and otro_jugador != jugador:
                 df_j1 = player_data
-                df_j2 = query_player_stats(player_name=otro_jugador)
+                df_j2 = query_player_stats(player_name=otro_jugador, columns=['game_id', 'pts', 'reb', 'ast'])
                 
                 common_games = set(df_j1['game_id']).intersection(set(df_j2['game_id']))
                 
@@ -609,118 +659,121 @@ elif st.session_state.page == "💰 Buscador de Cuotas":
     if api_key_input:
         st.session_state.odds_api_key = api_key_input
 
-    tipo_mercado = st.selectbox("¿Qué quieres buscar?", ["Ganador Partido (H2H)", "Puntos de Jugador"])
-    market_key = 'h2h' if tipo_mercado == "Ganador Partido (H2H)" else 'player_points'
-
-    cached_file = load_cache()
-    odds_data_to_show = None
-
-    if cached_file:
-        cache_time = cached_file.get('timestamp', 'Desconocido')
-        cache_market = cached_file.get('market', '')
-        if cache_market == market_key:
-            st.markdown(f"""
-            <div class='odds-info'>
-                <div>📅 DATOS GUARDADOS DEL:</div>
-                <div class='odds-timestamp'>{cache_time}</div>
-                <div style='font-size:12px; margin-top:5px;'>(Tus amigos ven esto sin gastar cuota)</div>
-            </div>
-            """, unsafe_allow_html=True)
-            odds_data_to_show = cached_file.get('data')
-        else:
-            st.info(f"Hay datos guardados de '{cache_market}', pero tú buscas '{market_key}'. Dale al botón para actualizar.")
+    mercados = {"Ganador Partido (H2H)": 'h2h', "Hándicap (Spreads)": 'spreads',
+                "Totales (Más/Menos)": 'totals', "Puntos de Jugador": 'player_points'}
+    tipo_mercado = st.selectbox("¿Qué quieres buscar?", list(mercados))
+    market_key = mercados[tipo_mercado]
+
+    # Última captura guardada de este mercado (cada mercado conserva la suya), ya normalizada
+    snapshot = latest_snapshot_info(market_key)
+    odds_table = None
+
+    if snapshot:
+        st.markdown(f"""
+        <div class='odds-info'>
+            <div>📅 DATOS GUARDADOS DEL:</div>
+            <div class='odds-timestamp'>{snapshot['timestamp']}</div>
+            <div style='font-size:12px; margin-top:5px;'>(Tus amigos ven esto sin gastar cuota)</div>
+        </div>
+        """, unsafe_allow_html=True)
+        odds_table = load_odds_table(market_key, snapshot['region'], snapshot['fetched_at'])
+    else:
+        st.info(f"No hay datos guardados de '{market_key}'. Dale al botón para actualizar.")
 
-    if st.button("🔄 Actualizar y Guardar (Gasta Cuota API)"):
+    c_market, c_board = st.columns(2)
+    refresh_market = c_market.button("🔄 Actualizar y Guardar (Gasta Cuota API)")
+    refresh_board = c_board.button("📋 Actualizar todos los mercados",
+                                   help="H2H, hándicap, totales y puntos de jugador con el mínimo de llamadas (gasta más cuota).")
+    if refresh_market or refresh_board:
         if not st.session_state.odds_api_key:
             st.error("Falta API Key.")
         else:
-            with st.spinner(f"Escaneando casas de apuestas ({tipo_mercado})..."):
-                odds_data, error = get_sports_odds(st.session_state.odds_api_key, market_key)
-                if error:
-                    st.error(error)
-                elif not odds_data:
+            with st.spinner(f"Escaneando casas de apuestas ({'todos los mercados' if refresh_board else tipo_mercado})..."):
+                status, message = refresh_odds(st.session_state.odds_api_key,
+                                               BOARD_MARKETS if refresh_board else market_key)
+                if status == 'ok':
+                    st.rerun()
+                elif status == 'recent':
+                    st.info("Las cuotas se acaban de actualizar: se muestran las guardadas sin gastar cuota.")
+                elif status == 'empty':
                     st.info("No hay datos disponibles ahora mismo.")
                 else:
-                    save_cache(odds_data, market_key)
-                    odds_data_to_show = odds_data
-                    st.rerun()
-
-    if odds_data_to_show and market_key == 'h2h':
-        value_alerts = detect_value_odds(odds_data_to_show, threshold=0.10)
-        if value_alerts:
-            st.subheader("🔔 Alertas de Valor (Cuotas >10% sobre la media)")
-            df_alerts = pd.DataFrame(value_alerts)
-            df_alerts.columns = ['Partido', 'Equipo', 'Casa', 'Cuota', 'Media', 'Sobre%']
+                    st.error(message)
+
+    quota = get_quota()
+    if quota:
+        st.caption(f"🎟️ Créditos de la API: quedan {quota['remaining']} (usados {quota['used']})")
+
+    if odds_table is not None and not odds_table.empty:
+        df_alerts = detect_value_odds(odds_table, market_key)
+        if not df_alerts.empty:
+            st.subheader("🔔 Alertas de Valor (cuota por encima de la probabilidad de consenso sin margen)")
+            df_alerts = df_alerts.drop(columns=['market'])
+            df_alerts.columns = ['Partido', 'Selección', 'Casa', 'Cuota', 'Cuota justa', 'Valor%']
             mostrar_tabla_como_tarjetas(df_alerts, max_cols=2)
 
-    if odds_data_to_show:
+    if odds_table is not None:
+        market_odds = odds_table[odds_table['market'] == market_key]
         if market_key == 'h2h':
-            for game in odds_data_to_show:
-                home, away = game['home_team'], game['away_team']
-                bookmakers = game.get('bookmakers', [])
-                if not bookmakers:
+            for _, game in market_odds.groupby('game', sort=False):
+                home, away = game['home_team'].iloc[0], game['away_team'].iloc[0]
+                # Una fila por casa con las dos cuotas (solo casas que cotizan ambos lados)
+                all_odds = game.loc[game['outcome'] == home, ['bookmaker', 'price']].drop_duplicates('bookmaker').merge(
+                    game.loc[game['outcome'] == away, ['bookmaker', 'price']].drop_duplicates('bookmaker'),
+                    on='bookmaker', suffixes=('_home', '_away')
+                )
+                if all_odds.empty:
                     continue
-
-                best_home, best_away = {'p': 0, 'b': ''}, {'p': 0, 'b': ''}
-                worst_home, worst_away = {'p': 100, 'b': ''}, {'p': 100, 'b': ''}
-                all_odds = []
-
-                for bm in bookmakers:
-                    markets = bm.get('markets', [])
-                    if not markets:
-                        continue
-                    outcomes = markets[0].get('outcomes', [])
-                    o_h = next((x for x in outcomes if x['name'] == home), None)
-                    o_a = next((x for x in outcomes if x['name'] == away), None)
-                    if o_h and o_a:
-                        ph, pa = o_h['price'], o_a['price']
-                        all_odds.append({'Casa': bm['title'], f'{home}': ph, f'{away}': pa})
-                        if ph > best_home['p']:
-                            best_home = {'p': ph, 'b': bm['title']}
-                        if ph < worst_home['p']:
-                            worst_home = {'p': ph, 'b': bm['title']}
-                        if pa > best_away['p']:
-                            best_away = {'p': pa, 'b': bm['title']}
-                        if pa < worst_away['p']:
-                            worst_away = {'p': pa, 'b': bm['title']}
+                best_home = all_odds.loc[all_odds['price_home'].idxmax()]
+                best_away = all_odds.loc[all_odds['price_away'].idxmax()]
 
                 st.markdown(f"#### 🏀 {away} @ {home}")
                 c1, c2 = st.columns(2)
-                c1.success(f"🏠 {home}: Mejor {best_home['p']} ({best_home['b']})")
-                c2.success(f"✈️ {away}: Mejor {best_away['p']} ({best_away['b']})")
+                c1.success(f"🏠 {home}: Mejor {best_home['price_home']} ({best_home['bookmaker']})")
+                c2.success(f"✈️ {away}: Mejor {best_away['price_away']} ({best_away['bookmaker']})")
 
                 if st.checkbox(f"Ver lista completa {home} vs {away}"):
-                    st.table(pd.DataFrame(all_odds))
+                    st.table(all_odds.set_axis(['Casa', f'{home}', f'{away}'], axis=1))
+                st.divider()
+
+        elif market_key in ('spreads', 'totals'):
+            for _, game in market_odds.groupby('game', sort=False):
+                home, away = game['home_team'].iloc[0], game['away_team'].iloc[0]
+                side_a, side_b = (home, away) if market_key == 'spreads' else ('Over', 'Under')
+                # Una fila por casa con línea y cuota de cada lado
+                all_odds = game.loc[game['outcome'] == side_a, ['bookmaker', 'point', 'price']].drop_duplicates('bookmaker').merge(
+                    game.loc[game['outcome'] == side_b, ['bookmaker', 'point', 'price']].drop_duplicates('bookmaker'),
+                    on='bookmaker', suffixes=('_a', '_b')
+                )
+                if all_odds.empty:
+                    continue
+                best_a = all_odds.loc[all_odds['price_a'].idxmax()]
+                best_b = all_odds.loc[all_odds['price_b'].idxmax()]
+
+                st.markdown(f"#### 🏀 {away} @ {home}")
+                c1, c2 = st.columns(2)
+                c1.success(f"{side_a} {best_a['point_a']:+g}: Mejor {best_a['price_a']} ({best_a['bookmaker']})"
+                           if market_key == 'spreads' else
+                           f"Más de {best_a['point_a']:g}: Mejor {best_a['price_a']} ({best_a['bookmaker']})")
+                c2.success(f"{side_b} {best_b['point_b']:+g}: Mejor {best_b['price_b']} ({best_b['bookmaker']})"
+                           if market_key == 'spreads' else
+                           f"Menos de {best_b['point_b']:g}: Mejor {best_b['price_b']} ({best_b['bookmaker']})")
+
+                if st.checkbox(f"Ver lista completa {home} vs {away} ({tipo_mercado})"):
+                    st.table(all_odds.set_axis(['Casa', f'Línea {side_a}', f'{side_a}', f'Línea {side_b}', f'{side_b}'], axis=1))
                 st.divider()
 
         elif market_key == 'player_points':
             found = False
-            for game in odds_data_to_show:
-                bookmakers = game.get('bookmakers', [])
-                if not bookmakers:
-                    continue
-                player_data_dict = {}
-                for bm in bookmakers:
-                    markets = bm.get('markets', [])
-                    for m in markets:
-                        if m['key'] == 'player_points':
-                            for out in m['outcomes']:
-                                p_name = out['description']
-                                line = out.get('point')
-                                side = out['name']
-                                price = out['price']
-                                if p_name not in player_data_dict:
-                                    player_data_dict[p_name] = []
-                                player_data_dict[p_name].append({'Casa': bm['title'], 'Linea': line, 'Tipo': side, 'Cuota': price})
-
-                if player_data_dict:
-                    found = True
-                    st.markdown(f"#### 🏀 {game['away_team']} @ {game['home_team']}")
-                    for p_name, odds_list in player_data_dict.items():
-                        with st.container():
-                            st.markdown(f"**👤 {p_name}**")
-                            st.table(pd.DataFrame(odds_list))
-                    st.divider()
+            for game_name, game in market_odds.groupby('game', sort=False):
+                found = True
+                st.markdown(f"#### 🏀 {game_name}")
+                for p_name, odds_list in game.groupby('description', sort=False):
+                    with st.container():
+                        st.markdown(f"**👤 {p_name}**")
+                        st.table(odds_list[['bookmaker', 'point', 'outcome', 'price']]
+                                 .set_axis(['Casa', 'Linea', 'Tipo', 'Cuota'], axis=1).reset_index(drop=True))
+                st.divider()
 
             if not found:
                 st.warning("No hay datos de jugadores disponibles en este momento. Puede que el mercado esté cerrado.")
@@ -737,8 +790,11 @@ elif st.session_state.page == "🏟️ Equipos":
         team = st.selectbox("Equipo", equipos, index=idx_team)
         st.session_state.selected_team = team
 
-        team_df = df[df['team_abbreviation'] == team].copy()
-        if team_df.empty:
+        # Box scores del equipo y totales de sus jugadores: tablas materializadas al sincronizar
+        games = get_team_games([team]).rename(columns={
+            'pts': 'PTS', 'reb': 'REB', 'ast': 'AST', 'fg3m': '3PM', 'min': 'MIN'
+        })
+        if games.empty:
             st.info("Sin datos para este equipo.")
         else:
             # Header visual (más “StatMuse-like”)
@@ -762,14 +818,6 @@ elif st.session_state.page == "🏟️ Equipos":
             </div>
             """, unsafe_allow_html=True)
 
-            # Agregado por partido (tipo StatMuse team game log)
-            games = team_df.groupby(['game_id', 'game_date', 'matchup', 'wl'], dropna=False).agg(
-                PTS=('pts', 'sum'),
-                REB=('reb', 'sum'),
-                AST=('ast', 'sum'),
-                **{'3PM': ('fg3m', 'sum')},
-                MIN=('min', 'sum')
-            ).reset_index()
             games = games.sort_values('game_date', ascending=False)
 
             wins = int((games['wl'] == 'W').sum()) if 'wl' in games.columns else 0
@@ -785,7 +833,7 @@ elif st.session_state.page == "🏟️ Equipos":
 
             # Mini gráfico de forma (últimos 10)
             if len(games) >= 2:
-                form = games.head(10).copy()
+                form = games.head(10)
                 form = form.sort_values('game_date')
                 form['FECHA'] = form['game_date'].dt.strftime('%d/%m')
                 fig_form = px.bar(form, x='FECHA', y='PTS', title=f"{team} – PTS últimos 10 partidos", labels={'FECHA': 'Fecha', 'PTS': 'PTS'})
@@ -839,9 +887,9 @@ elif st.session_state.page == "🏟️ Equipos":
 
             with tab_schedule:
                 st.subheader("📅 Últimos partidos")
-                sched = games.head(12).copy()
+                sched = games.head(12)
                 sched['FECHA'] = sched['game_date'].dt.strftime('%d/%m')
-                sched['RES'] = sched['wl'].map({'W': '✅', 'L': '❌'}).fillna('')
+                sched['RES'] = sched['wl'].astype(object).map({'W': '✅', 'L': '❌'}).fillna('')
                 sched['PARTIDO'] = sched['matchup']
                 sched['PTS'] = sched['PTS'].fillna(0).astype(int)
                 sched['REB'] = sched['REB'].fillna(0).astype(int)
@@ -853,24 +901,20 @@ elif st.session_state.page == "🏟️ Equipos":
 
             with tab_leaders:
                 st.subheader("🏅 Leaders")
-                current_players = [p for p, t in latest_teams_map.items() if t == team]
-                leaders_df = df[(df['team_abbreviation'] == team) & (df['player_name'].isin(current_players))].copy()
-                if leaders_df.empty:
-                    leaders_df = df[df['team_abbreviation'] == team].copy()
-
-                leaders = leaders_df.groupby('player_name').agg(
-                    GP=('game_id', 'count'),
-                    PTS=('pts', 'mean'),
-                    REB=('reb', 'mean'),
-                    AST=('ast', 'mean'),
-                    **{'3PM': ('fg3m', 'mean')},
-                    MIN=('min', 'mean')
-                ).reset_index()
+                team_players = get_team_players(team)
+                if not team_players.empty and team_players['is_current'].any():
+                    team_players = team_players[team_players['is_current'] == 1]
+
+                leaders = pd.DataFrame(columns=['player_name', 'GP', 'PTS', 'REB', 'AST', '3PM', 'MIN'])
+                if not team_players.empty:
+                    leaders = pd.DataFrame({'player_name': team_players['player_name'], 'GP': team_players['gp']})
+                    for col, label in (('pts', 'PTS'), ('reb', 'REB'), ('ast', 'AST'), ('fg3m', '3PM'), ('min', 'MIN')):
+                        leaders[label] = team_players[col] / team_players['gp']
                 leaders = leaders.sort_values('PTS', ascending=False).head(15)
                 leaders[['PTS', 'REB', 'AST', '3PM', 'MIN']] = leaders[['PTS', 'REB', 'AST', '3PM', 'MIN']].round(1)
                 leaders = leaders.rename(columns={'player_name': 'JUGADOR'})
                 # Leaders en tarjetas (más visual) + tabla compacta debajo
-                top5 = leaders.head(5).copy()
+                top5 = leaders.head(5)
                 if not top5.empty:
                     cols = st.columns(5, gap="small")
                     for i in range(len(top5)):
@@ -914,22 +958,24 @@ elif st.session_state.page == "⚔️ Analizar Partido":
 
         if t1 and t1 != st.session_state.selected_home:
             st.session_state.selected_home = t1
+            st.session_state.selected_game_id = None
         if t2 and t2 != st.session_state.selected_visitor:
             st.session_state.selected_visitor = t2
+            st.session_state.selected_game_id = None
 
         if t1 and t2:
-            from nba_api.stats.static import teams as nba_static_teams
-            nba_teams = nba_static_teams.get_teams()
-            team_map_id = {t['abbreviation']: t['id'] for t in nba_teams}
-            roster_t1, roster_t2 = {}, {}
-            if t1 in team_map_id:
-                roster_t1 = get_team_roster_numbers(team_map_id[t1])
-            if t2 in team_map_id:
-                roster_t2 = get_team_roster_numbers(team_map_id[t2])
+            # Rosters, próximo partido y lesiones se piden a la vez
+            with st.spinner("Cargando rosters, calendario y partes médicos..."):
+                context = fetch_matchup_context(t1, t2)
+            roster_t1, roster_t2 = context['roster_t1'], context['roster_t2']
             full_roster_map = {**roster_t1, **roster_t2}
+            next_game = context['next_game']
+            injuries = context['injuries']
+            if context['pending']:
+                nombres = {'roster_t1': f"roster {t1}", 'roster_t2': f"roster {t2}",
+                           'next_game': "calendario", 'injuries': "lesiones"}
+                st.caption("⏱️ Sin respuesta a tiempo: " + ", ".join(nombres[k] for k in context['pending']))
 
-            with st.spinner("Cargando..."):
-                next_game = get_next_matchup_info(t1, t2)
             if next_game:
                 link_btn = f"<a href='https://www.nba.com/game/{next_game['game_id']}' target='_blank' class='next-game-btn'>🏥 Ver Ficha</a>"
                 st.markdown(f"""
@@ -946,9 +992,6 @@ elif st.session_state.page == "⚔️ Analizar Partido":
             st.write("---")
             st.subheader("🏥 Lesiones reportadas")
 
-            with st.spinner("Cargando partes médicos..."):
-                injuries = get_injuries()
-
             if injuries:
                 inj_t1 = [i for i in injuries if i.get('team') == t1]
                 inj_t2 = [i for i in injuries if i.get('team') == t2]
@@ -997,40 +1040,23 @@ elif st.session_state.page == "⚔️ Analizar Partido":
             else:
                 st.error("❌ No se pudo conectar con la fuente de lesiones")
 
-            # HISTORIAL H2H
-            mask = ((df['team_abbreviation'] == t1) & (df['matchup'].str.contains(t2))) | \
-            ((df['team_abbreviation'] == t2) & (df['matchup'].str.contains(t1)))
-            
-            history = df[mask].sort_values('game_date', ascending=False)
-            last_dates = sorted(history['game_date'].unique(), reverse=True)[:5]
+            # HISTORIAL H2H (paquete de análisis: precalculado para la jornada o calculado ahora)
+            bundle = obtener_analisis(t1, t2)
+            target_dates_str = bundle['target_dates_str']
+            stats = bundle['stats']
+            card_trends = bundle['card_trends']
+            card_index = bundle['card_index']
+            season_pts = load_player_aggregates().reindex(columns=['pts'])['pts']
+
+            def card_series(player_name):
+                if player_name in card_trends.index:
+                    return card_trends.loc[player_name]
+                return pd.Series(" • ".join(["X"] * len(target_dates_str)), index=card_trends.columns)
 
             st.markdown("<div class='section-divider'></div>", unsafe_allow_html=True)
             st.markdown("<div class='section-title'>📅 Historial H2H</div>", unsafe_allow_html=True)
 
-            games_summary = []
-            for date in last_dates:
-                day_data = history[history['game_date'] == date]
-                if day_data.empty:
-                    continue
-                row_t1 = day_data[day_data['team_abbreviation'] == t1]
-                if not row_t1.empty:
-                    wl_t1 = row_t1.iloc[0]['wl']
-                    icon1 = '✅' if wl_t1 == 'W' else '❌'
-                    icon2 = '❌' if wl_t1 == 'W' else '✅'
-                else:
-                    row_t2 = day_data[day_data['team_abbreviation'] == t2]
-                    if not row_t2.empty:
-                        wl_t2 = row_t2.iloc[0]['wl']
-                        icon2 = '✅' if wl_t2 == 'W' else '❌'
-                        icon1 = '❌' if wl_t2 == 'W' else '✅'
-                    else:
-                        icon1, icon2 = '', ''
-                match_str = f"{t1} {icon1} vs {t2} {icon2}"
-                row = day_data.iloc[0]
-                g_id = row.get('game_id')
-                link = f"<a href='https://www.nba.com/game/{g_id}' target='_blank' class='match-link'>📊</a>" if pd.notnull(g_id) else "-"
-                games_summary.append({'FECHA': date.strftime('%d/%m'), 'ENFRENTAMIENTO': match_str, 'FICHA': link})
-
+            games_summary = bundle['games_summary']
             df_games = pd.DataFrame(games_summary)
             if not df_games.empty:
                 # Resumen visual + tabla en card
@@ -1050,73 +1076,13 @@ elif st.session_state.page == "⚔️ Analizar Partido":
                 mostrar_tabla_como_tarjetas(df_games, max_cols=1)
                 st.markdown("</div>", unsafe_allow_html=True)
 
-            team_totals = history.groupby(['game_date', 'team_abbreviation'])[['pts', 'reb', 'ast']].sum().reset_index()
-            filtered_totals = team_totals[team_totals['team_abbreviation'].isin([t1, t2])].copy()
-            if not filtered_totals.empty:
+            df_comparative = bundle['comparative']
+            if not df_comparative.empty:
                 st.markdown("<div class='section-divider'></div>", unsafe_allow_html=True)
                 st.markdown("<div class='section-title'>📊 Comparativa H2H</div>", unsafe_allow_html=True)
-                game_stats = []
-                unique_game_dates = filtered_totals['game_date'].unique()
-                for d in sorted(unique_game_dates, reverse=True):
-                    day_data = filtered_totals[filtered_totals['game_date'] == d]
-                    if not day_data.empty:
-                        row = {'FECHA': pd.to_datetime(d).strftime('%d/%m')}
-                        t1_d = day_data[day_data['team_abbreviation'] == t1]
-                        row[f'{t1} PTS'] = t1_d['pts'].values[0] if not t1_d.empty else 0
-                        row[f'{t1} REB'] = t1_d['reb'].values[0] if not t1_d.empty else 0
-                        row[f'{t1} AST'] = t1_d['ast'].values[0] if not t1_d.empty else 0
-                        t2_d = day_data[day_data['team_abbreviation'] == t2]
-                        row[f'{t2} PTS'] = t2_d['pts'].values[0] if not t2_d.empty else 0
-                        row[f'{t2} REB'] = t2_d['reb'].values[0] if not t2_d.empty else 0
-                        row[f'{t2} AST'] = t2_d['ast'].values[0] if not t2_d.empty else 0
-                        game_stats.append(row)
-                if game_stats:
-                    df_comparative = pd.DataFrame(game_stats)
-                    cols_ordered = ['FECHA', f'{t1} PTS', f'{t2} PTS', f'{t1} REB', f'{t2} REB', f'{t1} AST', f'{t2} AST']
-                    final_cols = [c for c in cols_ordered if c in df_comparative.columns]
-                    st.markdown("<div class='card-elevated' style='padding:16px 16px;'>", unsafe_allow_html=True)
-                    mostrar_tabla_como_tarjetas(df_comparative[final_cols], max_cols=2)
-                    st.markdown("</div>", unsafe_allow_html=True)
-
-            recent_players = history[history['game_date'].isin(last_dates)].sort_values('game_date', ascending=False)
-            target_dates_str = [d.strftime('%Y-%m-%d') for d in last_dates]
-            recent_players['date_str'] = recent_players['game_date'].dt.strftime('%Y-%m-%d')
-
-            def get_aligned_trend(df_source, val_col):
-                pivoted = df_source.pivot_table(
-                    index=['player_name', 'team_abbreviation'],
-                    columns='date_str',
-                    values=val_col,
-                    aggfunc='sum'
-                )
-                for d in target_dates_str:
-                    if d not in pivoted.columns:
-                        pivoted[d] = float('nan')
-                pivoted = pivoted[target_dates_str]
-                def formatter(row):
-                    vals = []
-                    for v in row:
-                        if pd.isna(v) or v == 0:
-                            vals.append("❌")
-                        else:
-                            vals.append(str(int(v)))
-                    return "/".join(vals)
-                return pivoted.apply(formatter, axis=1)
-
-            base_stats = recent_players.groupby(['player_name', 'team_abbreviation']).agg(
-                pts=('pts', 'mean'),
-                reb=('reb', 'mean'),
-                ast=('ast', 'mean'),
-                gp=('game_date', 'count')
-            )
-
-            trend_pts = get_aligned_trend(recent_players, 'pts').rename('trend_pts')
-            trend_reb = get_aligned_trend(recent_players, 'reb').rename('trend_reb')
-            trend_ast = get_aligned_trend(recent_players, 'ast').rename('trend_ast')
-            trend_min = get_aligned_trend(recent_players, 'min').rename('trend_min')
-
-            stats = base_stats.join([trend_pts, trend_reb, trend_ast, trend_min]).reset_index()
-            stats = stats[stats['player_name'].apply(lambda x: latest_teams_map.get(x) in [t1, t2])]
+                st.markdown("<div class='card-elevated' style='padding:16px 16px;'>", unsafe_allow_html=True)
+                mostrar_tabla_como_tarjetas(df_comparative, max_cols=2)
+                st.markdown("</div>", unsafe_allow_html=True)
 
                         # ==========================================
             # TOP ANOTADORES - CORREGIDO Y BIEN INDENTADO
@@ -1133,54 +1099,27 @@ elif st.session_state.page == "⚔️ Analizar Partido":
                         team = row['team_abbreviation']
                         avg_pts_vs = row['pts']  # media vs este rival (H2H reciente)
                         
-                        # Logs temporada completa (para media de temporada)
-                        season_logs = df[df['player_name'] == player_name].sort_values('game_date', ascending=False)
-                        season_avg_pts = season_logs['pts'].mean() if not season_logs.empty else avg_pts_vs
+                        # Media de temporada (tabla de agregados)
+                        season_avg_pts = season_pts.get(player_name, avg_pts_vs)
 
                         # Determinar rival para el texto
                         opponent = t2 if team == t1 else t1
 
-                        # Logs recientes (últimos 5 partidos contra este rival)
-                        player_logs = history[history['player_name'] == player_name].sort_values('game_date', ascending=False).head(5)
-                        
-                        # Calcular desglose de puntos
-                        if not player_logs.empty:
-                            avg_fgm = player_logs['fgm'].mean() if 'fgm' in player_logs.columns else 0
-                            avg_fg3m = player_logs['fg3m'].mean() if 'fg3m' in player_logs.columns else 0
-                            avg_ftm = player_logs['ftm'].mean() if 'ftm' in player_logs.columns else 0
-                            
-                            avg_2pt = (avg_fgm - avg_fg3m) * 2
-                            avg_3pt = avg_fg3m * 3
-                            avg_ft = avg_ftm
+                        # Desglose de puntos en sus últimos 5 cruces (índice por jugador del análisis)
+                        if player_name in card_index.index:
+                            card = card_index.loc[player_name]
+                            avg_2pt, avg_3pt, avg_ft = card['avg_2pt'], card['avg_3pt'], card['avg_ft']
+                            avg_3pm_made = float(card['avg_3pm'])
                         else:
-                            avg_2pt = 0
-                            avg_3pt = 0
-                            avg_ft = 0
-                        
-                        # Construir HTML del desglose directamente en la tarjeta
+                            avg_2pt = avg_3pt = avg_ft = 0
+                            avg_3pm_made = 0.0
                         
-                        # Generar series alineadas con los últimos 5 partidos del equipo
-                        target_dates = target_dates_str[:5] # from target_dates_str defined above
-                        pts_vals = []
-                        min_vals = []
-                        tpm_vals = []
-                        
-                        for d in target_dates:
-                            match = player_logs[player_logs['game_date'].dt.strftime('%Y-%m-%d') == d]
-                            if not match.empty:
-                                pts_vals.append(str(int(match['pts'].values[0])))
-                                min_vals.append(str(int(match['min'].values[0])) if 'min' in match.columns else "X")
-                                tpm_vals.append(str(int(match['fg3m'].values[0])) if 'fg3m' in match.columns else "X")
-                            else:
-                                pts_vals.append("X")
-                                min_vals.append("X")
-                                tpm_vals.append("X")
-                                
-                        avg_3pm_made = float(player_logs['fg3m'].mean()) if not player_logs.empty and 'fg3m' in player_logs.columns else 0.0
+                        # Series alineadas con los últimos 5 partidos (del pivot de tendencias)
+                        series = card_series(player_name)
                         
-                        pts_series = " • ".join(pts_vals)
-                        min_series = " • ".join(min_vals)
-                        tpm_series = " • ".join(tpm_vals)
+                        pts_series = series['pts']
+                        min_series = series['min']
+                        tpm_series = series['fg3m']
                         
                         # Tarjeta 1: media (PPG)
                         st.markdown(html_clean(f"""
@@ -1270,23 +1209,9 @@ elif st.session_state.page == "⚔️ Analizar Partido":
                         team = row['team_abbreviation']
                         avg_reb = row['reb']
                         
-                        player_logs = history[history['player_name'] == player_name].sort_values('game_date', ascending=False).head(5)
-                        
-                        target_dates = target_dates_str[:5]
-                        reb_vals = []
-                        min_vals = []
-                        
-                        for d in target_dates:
-                            match = player_logs[player_logs['game_date'].dt.strftime('%Y-%m-%d') == d]
-                            if not match.empty:
-                                reb_vals.append(str(int(match['reb'].values[0])))
-                                min_vals.append(str(int(match['min'].values[0])) if 'min' in match.columns else "X")
-                            else:
-                                reb_vals.append("X")
-                                min_vals.append("X")
-                                
-                        reb_series = " • ".join(reb_vals)
-                        min_series = " • ".join(min_vals)
+                        series = card_series(player_name)
+                        reb_series = series['reb']
+                        min_series = series['min']
                         
                         # Tarjeta 1: media (RPG)
                         st.markdown(html_clean(f"""
@@ -1355,23 +1280,9 @@ elif st.session_state.page == "⚔️ Analizar Partido":
                         team = row['team_abbreviation']
                         avg_ast = row['ast']
                         
-                        player_logs = history[history['player_name'] == player_name].sort_values('game_date', ascending=False).head(5)
-                        
-                        target_dates = target_dates_str[:5]
-                        ast_vals = []
-                        min_vals = []
-                        
-                        for d in target_dates:
-                            match = player_logs[player_logs['game_date'].dt.strftime('%Y-%m-%d') == d]
-                            if not match.empty:
-                                ast_vals.append(str(int(match['ast'].values[0])))
-                                min_vals.append(str(int(match['min'].values[0])) if 'min' in match.columns else "X")
-                            else:
-                                ast_vals.append("X")
-                                min_vals.append("X")
-                                
-                        ast_series = " • ".join(ast_vals)
-                        min_series = " • ".join(min_vals)
+                        series = card_series(player_name)
+                        ast_series = series['ast']
+                        min_series = series['min']
                         
                         # Tarjeta 1: media (APG)
                         st.markdown(html_clean(f"""
@@ -1429,41 +1340,8 @@ elif st.session_state.page == "⚔️ Analizar Partido":
             st.write("---")
             st.subheader("🏥 Historial de Bajas (Jugadores con >12 min promedio)")
 
-            all_players_min = recent_players.groupby(['player_name', 'team_abbreviation'])['min'].mean().reset_index()
-            key_players = all_players_min[all_players_min['min'] > 12.0].copy()
-            key_players = key_players[key_players['team_abbreviation'].isin([t1, t2])]
-
-            if not key_players.empty:
-                dnp_data = []
-                for date in last_dates[:5]:
-                    date_str = date.strftime('%d/%m')
-                    players_in_game = recent_players[recent_players['game_date'] == date]['player_name'].tolist()
-                    
-                    missing_t1 = []
-                    missing_t2 = []
-                    
-                    for _, row in key_players.iterrows():
-                        player = row['player_name']
-                        team = row['team_abbreviation']
-                        
-                        team_played = not recent_players[(recent_players['game_date'] == date) & 
-                                                        (recent_players['team_abbreviation'] == team)].empty
-                        
-                        if team_played and player not in players_in_game:
-                            if team == t1:
-                                missing_t1.append(player)
-                            elif team == t2:
-                                missing_t2.append(player)
-                    
-                    cell_t1 = f"<span class='dnp-missing'>{', '.join(missing_t1)}</span>" if missing_t1 else "<span class='dnp-full'>✓ Todos disponibles</span>"
-                    cell_t2 = f"<span class='dnp-missing'>{', '.join(missing_t2)}</span>" if missing_t2 else "<span class='dnp-full'>✓ Todos disponibles</span>"
-                    
-                    dnp_data.append({
-                        'FECHA': date_str,
-                        f'BAJAS {t1}': cell_t1,
-                        f'BAJAS {t2}': cell_t2
-                    })
-                
+            dnp_data = bundle['dnp']
+            if dnp_data is not None:
                 if dnp_data:
                     df_dnp = pd.DataFrame(dnp_data)
                     mostrar_tabla_como_tarjetas(df_dnp, max_cols=1)
@@ -1475,54 +1353,8 @@ elif st.session_state.page == "⚔️ Analizar Partido":
             # PATRONES
             st.write("---")
             st.subheader("🕵️ Patrones")
-            global_means = df.groupby('player_name')[['pts', 'reb', 'ast']].mean()
-            star_scorers = global_means[global_means['pts'] > 18].index.tolist()
-            star_rebounders = global_means[global_means['reb'] > 7].index.tolist()
-            star_assisters = global_means[global_means['ast'] > 5].index.tolist()
-            all_stars = list(set(star_scorers + star_rebounders + star_assisters))
-            patterns_data = []
-
-            for date in last_dates:
-                roster_day = recent_players[recent_players['game_date'] == date]
-                players_present = roster_day['player_name'].unique()
-                teams_active = roster_day['team_abbreviation'].unique()
-                for team in teams_active:
-                    missing_stars_today = []
-                    for star in all_stars:
-                        current_real_team = latest_teams_map.get(star, None)
-                        if current_real_team == team and (star not in players_present):
-                            missing_stars_today.append(star)
-                    if missing_stars_today:
-                        teammates = roster_day[roster_day['team_abbreviation'] == team]
-                        beneficiaries = []
-                        for _, row in teammates.iterrows():
-                            p_name = row['player_name']
-                            if latest_teams_map.get(p_name) != team:
-                                continue
-                            if p_name in global_means.index:
-                                avg_p = global_means.loc[p_name]
-                            else:
-                                continue
-                            diff_pts = row['pts'] - avg_p['pts']
-                            diff_reb = row['reb'] - avg_p['reb']
-                            diff_ast = row['ast'] - avg_p['ast']
-                            impact_msgs = []
-                            if any(s in star_scorers for s in missing_stars_today):
-                                if row['pts'] >= 15 and diff_pts >= 8:
-                                    impact_msgs.append(f"🏀+{int(diff_pts)}")
-                            if any(s in star_rebounders for s in missing_stars_today):
-                                if row['reb'] >= 7 and diff_reb >= 4:
-                                    impact_msgs.append(f"🖐+{int(diff_reb)}")
-                            if any(s in star_assisters for s in missing_stars_today):
-                                if row['ast'] >= 5 and diff_ast >= 4:
-                                    impact_msgs.append(f"🎁+{int(diff_ast)}")
-                            if impact_msgs:
-                                beneficiaries.append(f"<b>{p_name}</b> ({', '.join(impact_msgs)})")
-                        if beneficiaries:
-                            date_str = date.strftime('%d/%m')
-                            missing_str = ", ".join(missing_stars_today)
-                            impact_str = "<br>".join(beneficiaries)
-                            patterns_data.append({'FECHA': date_str, 'EQUIPO': team, 'FALTA': f"<span class='pat-stars'>{missing_str}</span>", 'IMPACTO': f"<span class='pat-impact'>{impact_str}</span>"})
+            # Filtrado de la tabla de impacto de toda la liga (precalculada al sincronizar)
+            patterns_data = bundle['patterns']
             if patterns_data:
                 df_patterns = pd.DataFrame(patterns_data)
                 mostrar_tabla_como_tarjetas(df_patterns, max_cols=1)
@@ -1533,50 +1365,7 @@ elif st.session_state.page == "⚔️ Analizar Partido":
             st.write("---")
             st.subheader("🎲 Generador de Parlays (selecciona piernas)")
 
-            min_games_needed = max(3, int(len(last_dates) * 0.6))
-            candidates = stats[stats['gp'] >= min_games_needed].copy()
-
-            safe_legs_pts, safe_legs_reb, safe_legs_ast = [], [], []
-            risky_legs_pts, risky_legs_reb, risky_legs_ast = [], [], []
-
-            for _, row in candidates.iterrows():
-                p_name, p_team = row['player_name'], row['team_abbreviation']
-                logs = recent_players[(recent_players['player_name'] == p_name) & (recent_players['team_abbreviation'] == p_team)]
-                if logs.empty:
-                    continue
-                
-                pts_vals = sorted(logs['pts'].tolist())
-                reb_vals = sorted(logs['reb'].tolist())
-                ast_vals = sorted(logs['ast'].tolist())
-                
-                if len(pts_vals) >= 2:
-                    safe_pts = pts_vals[1]
-                    if safe_pts >= 10:
-                        safe_legs_pts.append({'player': p_name, 'val': int(safe_pts), 'avg': row['pts'], 'type': 'PTS'})
-                
-                if len(reb_vals) >= 2:
-                    safe_reb = reb_vals[1]
-                    if safe_reb >= 5:
-                        safe_legs_reb.append({'player': p_name, 'val': int(safe_reb), 'avg': row['reb'], 'type': 'REB'})
-                
-                if len(ast_vals) >= 2:
-                    safe_ast = ast_vals[1]
-                    if safe_ast >= 3:
-                        safe_legs_ast.append({'player': p_name, 'val': int(safe_ast), 'avg': row['ast'], 'type': 'AST'})
-                
-                if row['pts'] >= 15:
-                    risky_legs_pts.append({'player': p_name, 'val': int(row['pts']), 'avg': row['pts'], 'type': 'PTS'})
-                if row['reb'] >= 7:
-                    risky_legs_reb.append({'player': p_name, 'val': int(row['reb']), 'avg': row['reb'], 'type': 'REB'})
-                if row['ast'] >= 5:
-                    risky_legs_ast.append({'player': p_name, 'val': int(row['ast']), 'avg': row['ast'], 'type': 'AST'})
-
-            safe_legs_pts.sort(key=lambda x: x['avg'], reverse=True)
-            safe_legs_reb.sort(key=lambda x: x['avg'], reverse=True)
-            safe_legs_ast.sort(key=lambda x: x['avg'], reverse=True)
-            risky_legs_pts.sort(key=lambda x: x['avg'], reverse=True)
-            risky_legs_reb.sort(key=lambda x: x['avg'], reverse=True)
-            risky_legs_ast.sort(key=lambda x: x['avg'], reverse=True)
+            legs = bundle['legs']
 
             def render_parlay_list(title, legs_list, col, col_prefix):
                 with col:
@@ -1608,9 +1397,9 @@ elif st.session_state.page == "⚔️ Analizar Partido":
 
             col_safe, col_risky = st.columns(2)
             
-            # Unimos las listas tomando las 3 mejores opciones de cada estadística
-            safe_combined = safe_legs_pts[:3] + safe_legs_reb[:3] + safe_legs_ast[:3]
-            risky_combined = risky_legs_pts[:3] + risky_legs_reb[:3] + risky_legs_ast[:3]
+            # Las 3 mejores opciones de cada estadística
+            safe_combined = legs['safe']
+            risky_combined = legs['risky']
 
             render_parlay_list("🛡️ CONSERVADOR (Piso)", safe_combined, col_safe, "safe")
             render_parlay_list("🚀 ARRIESGADO (Media)", risky_combined, col_risky, "risky")
@@ -2,73 +2,374 @@ import streamlit as st
 import pandas as pd
 import sqlite3
 import os
+import json
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from nba_api.stats.endpoints import leaguegamelog, scoreboardv2, commonteamroster
 from nba_api.stats.static import teams as nba_static_teams
 from datetime import datetime, timedelta
+from functools import lru_cache
 import requests
 from bs4 import BeautifulSoup
 import backoff
+import pyarrow.parquet as pq
+from utils import run_concurrently, get_basketball_date
+from db import DB_PATH, get_write_connection, read_sql, reset_pool, table_columns
+from aggregates import refresh_player_aggregates, refresh_team_games
+from analysis import refresh_absence_impact
+
+# El dataset se comparte entre sesiones (cache_resource): con copy-on-write las vistas
+# y columnas derivadas nunca escriben sobre él (es el comportamiento por defecto desde pandas 3)
+if int(pd.__version__.split('.')[0]) < 3:
+    pd.set_option('mode.copy_on_write', True)
 
-DB_PATH = "nba.sqlite"
 CSV_FOLDER = "csv"
+STORE_PATH = "player_stats.parquet"
+
+# Tipos del almacén columnar: texto repetido como categoría y estadísticas en enteros pequeños
+CATEGORY_COLS = ['player_name', 'team_abbreviation', 'opponent_abbreviation', 'matchup', 'wl']
+FLOAT_COLS = ['fg_pct', 'min']
+
+def _add_matchup_columns(df):
+    """Rival y local/visitante desde matchup ("LAL vs. BOS" en casa, "LAL @ BOS" fuera)."""
+    matchup = df['matchup'].astype(str)
+    df['opponent_abbreviation'] = matchup.str.split(' ').str[-1]
+    df['is_home'] = matchup.str.contains(' vs. ', regex=False)
+    return df
+
+def _normalize_player_frame(df):
+    """Tipa el DataFrame de game logs una sola vez (en la ingesta, no en cada carga)."""
+    df = df.copy()
+    if 'game_date' in df.columns:
+        df['game_date'] = pd.to_datetime(df['game_date'])
+    if 'game_id' in df.columns:
+        df['game_id'] = df['game_id'].astype(str).str.zfill(10)
+    else:
+        df['game_id'] = None
+    if 'fg3m' not in df.columns:
+        df['fg3m'] = 0
+    if 'matchup' in df.columns and 'opponent_abbreviation' not in df.columns:
+        df = _add_matchup_columns(df)
+    for col in df.columns:
+        if col in CATEGORY_COLS:
+            df[col] = df[col].astype('category')
+        elif col == 'is_home':
+            df[col] = df[col].astype(bool)
+        elif col in FLOAT_COLS:
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype('float32')
+        elif col == 'player_id':
+            df[col] = df[col].astype('int32')
+        elif col not in ('game_date', 'game_id') and pd.api.types.is_numeric_dtype(df[col]):
+            if df[col].isna().any():
+                df[col] = df[col].astype('float32')
+            else:
+                df[col] = df[col].astype('int16')
+    return df
 
-@st.cache_data(ttl=86400)
-def load_data():
+def _write_store(df):
+    """Escribe el almacén Parquet de forma atómica."""
+    tmp_path = f"{STORE_PATH}.tmp"
+    _normalize_player_frame(df).to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, STORE_PATH)
+
+def _migrate_csv_store():
+    """Convierte el antiguo csv/player_stats.csv al almacén Parquet (una sola vez)."""
     csv_path = f"{CSV_FOLDER}/player_stats.csv"
-    if os.path.exists(csv_path):
-        df = pd.read_csv(csv_path)
-        if 'game_date' in df.columns:
-            df['game_date'] = pd.to_datetime(df['game_date'])
-        if 'game_id' in df.columns:
-            df['game_id'] = df['game_id'].astype(str).str.zfill(10)
-        else:
-            df['game_id'] = None
-        if 'fg3m' not in df.columns:
-            df['fg3m'] = 0
-        return df
+    if os.path.exists(csv_path) and not os.path.exists(STORE_PATH):
+        _write_store(pd.read_csv(csv_path))
+
+def _migrate_player_table(conn):
+    """Bases antiguas: añade opponent_abbreviation / is_home a `player` y los rellena desde matchup."""
+    cols = [r[1] for r in conn.execute('PRAGMA table_info(player)')]
+    if not cols or 'opponent_abbreviation' in cols:
+        return False
+    conn.execute('ALTER TABLE player ADD COLUMN opponent_abbreviation TEXT;')
+    conn.execute('ALTER TABLE player ADD COLUMN is_home INTEGER;')
+    conn.execute("""
+        UPDATE player SET
+            is_home = instr(matchup, ' vs. ') > 0,
+            opponent_abbreviation = CASE WHEN instr(matchup, ' vs. ') > 0
+                THEN substr(matchup, instr(matchup, ' vs. ') + 5)
+                ELSE substr(matchup, instr(matchup, ' @ ') + 3) END
+    """)
+    _create_player_indexes(conn)
+    conn.commit()
+    return True
+
+def _migrate_matchup_columns():
+    """Añade rival y local/visitante al almacén Parquet y a SQLite si vienen de una versión anterior."""
+    if os.path.exists(STORE_PATH) and 'opponent_abbreviation' not in pq.read_schema(STORE_PATH).names:
+        _write_store(pd.read_parquet(STORE_PATH))
+    if os.path.exists(DB_PATH):
+        conn = get_write_connection()
+        try:
+            migrated = _migrate_player_table(conn)
+        finally:
+            conn.close()
+        if migrated:
+            reset_pool()
+
+@st.cache_resource(ttl=86400)
+def load_data(columns=None):
+    """
+    Carga los game logs desde el almacén Parquet.
+    `columns` permite leer solo las columnas necesarias (proyección).
+    El DataFrame es el mismo objeto para todas las sesiones: tratarlo como de solo lectura.
+    """
+    _migrate_csv_store()
+    _migrate_matchup_columns()
+    if os.path.exists(STORE_PATH):
+        if columns is not None:
+            available = pq.read_schema(STORE_PATH).names
+            columns = [c for c in columns if c in available]
+        return pd.read_parquet(STORE_PATH, columns=columns)
     return pd.DataFrame()
 
-def download_data(seasons=None, progress_callback=None):
+def clear_caches():
+    """Invalida los resultados cacheados y el dataset compartido (tras sincronizar)."""
+    st.cache_data.clear()
+    load_data.clear()
+
+def _player_table_ready(conn):
+    """Comprueba que la tabla `player` existe y tiene la clave única (game_id, player_id)."""
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='player'").fetchone()
+    if not exists:
+        return False
+    try:
+        conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_player_game ON player(game_id, player_id);')
+        _migrate_player_table(conn)
+        return True
+    except sqlite3.Error:
+        # Duplicados en una base antigua: mejor rehacerla completa
+        return False
+
+def _get_sync_state(conn):
+    """Devuelve {temporada: (última game_date sincronizada, synced_at)}."""
+    conn.execute(
+        'CREATE TABLE IF NOT EXISTS sync_state (season TEXT PRIMARY KEY, last_game_date TEXT, synced_at TEXT);'
+    )
+    rows = conn.execute('SELECT season, last_game_date, synced_at FROM sync_state').fetchall()
+    return {season: (last_date, synced_at) for season, last_date, synced_at in rows}
+
+def seconds_since_last_sync():
+    """Segundos desde la última sincronización registrada (None si nunca se ha sincronizado)."""
+    try:
+        state = read_sql('SELECT MAX(synced_at) AS synced_at FROM sync_state')
+    except Exception:
+        return None
+    if state.empty or pd.isna(state['synced_at'].iloc[0]):
+        return None
+    return (datetime.now() - datetime.fromisoformat(state['synced_at'].iloc[0])).total_seconds()
+
+def data_version():
+    """Identificador de la versión de los datos: cambia cada vez que una sincronización reescribe el almacén."""
+    try:
+        return str(os.stat(STORE_PATH).st_mtime_ns)
+    except OSError:
+        return "0"
+
+def _upsert_player_rows(conn, df_clean):
+    """
+    INSERT OR REPLACE sobre `player` (clave única game_id, player_id) de las filas nuevas o cambiadas.
+    Devuelve esas filas de `df_clean`: vacío si el trozo ya estaba sincronizado.
+    """
+    table_cols = [r[1] for r in conn.execute('PRAGMA table_info(player)')]
+    cols = [c for c in df_clean.columns if c in table_cols]
+    col_list = ", ".join(cols)
+    # Tabla temporal con las mismas afinidades que `player`: rowid = posición en df_clean + 1
+    conn.execute('DROP TABLE IF EXISTS temp.player_incoming;')
+    conn.execute(f'CREATE TEMP TABLE player_incoming AS SELECT {col_list} FROM player WHERE 0;')
+    conn.executemany(
+        f"INSERT INTO player_incoming ({col_list}) VALUES ({', '.join('?' * len(cols))})",
+        df_clean[cols].itertuples(index=False, name=None)
+    )
+    same = " AND ".join(f"p.{c} IS i.{c}" for c in cols)
+    changed = [r[0] - 1 for r in conn.execute(f"""
+        SELECT i.rowid FROM player_incoming i
+        WHERE NOT EXISTS (SELECT 1 FROM player p WHERE p.game_id = i.game_id AND p.player_id = i.player_id AND {same})
+    """)]
+    if changed:
+        conn.execute(f"""
+            INSERT OR REPLACE INTO player ({col_list})
+            SELECT {col_list} FROM player_incoming i
+            WHERE NOT EXISTS (SELECT 1 FROM player p WHERE p.game_id = i.game_id AND p.player_id = i.player_id AND {same})
+        """)
+    conn.execute('DROP TABLE temp.player_incoming;')
+    return df_clean.iloc[changed]
+
+def _merge_into_store(df_clean):
+    """Añade/actualiza filas en el almacén Parquet por (game_id, player_id)."""
+    new_rows = _normalize_player_frame(df_clean)
+    _migrate_csv_store()
+    if os.path.exists(STORE_PATH):
+        merged = pd.concat([pd.read_parquet(STORE_PATH), new_rows], ignore_index=True)
+        new_rows = merged.drop_duplicates(['game_id', 'player_id'], keep='last')
+    _write_store(new_rows)
+
+GAMELOG_COLUMNS = ['PLAYER_ID', 'PLAYER_NAME', 'TEAM_ABBREVIATION', 'GAME_DATE', 'MATCHUP',
+                   'PTS', 'REB', 'AST', 'FG3M', 'FGM', 'FGA', 'FG_PCT', 'FG3A', 'FTM', 'FTA',
+                   'OREB', 'DREB', 'STL', 'BLK', 'TOV', 'MIN', 'WL', 'GAME_ID']
+
+# Límites frente a stats.nba.com (bloquea IPs que hacen demasiadas peticiones seguidas)
+NBA_MAX_WORKERS = 3
+NBA_MIN_INTERVAL = 0.6
+NBA_MAX_TRIES = 3
+
+class RateLimiter:
+    """Separación mínima entre peticiones, compartida por todos los hilos."""
+    def __init__(self, min_interval):
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.min_interval
+        if delay > 0:
+            time.sleep(delay)
+
+def _fetch_gamelog_chunk(season, season_type, date_from, limiter, max_tries):
+    """Descarga un trozo (temporada + tipo + fecha inicial) con reintentos y backoff."""
+    @backoff.on_exception(backoff.expo, Exception, max_tries=max_tries)
+    def _fetch():
+        limiter.wait()
+        params = {'date_from_nullable': date_from} if date_from else {}
+        gamelogs = leaguegamelog.LeagueGameLog(
+            season=season,
+            season_type_all_star=season_type,
+            player_or_team_abbreviation='P',
+            **params
+        )
+        return gamelogs.get_data_frames()[0]
+    return _fetch()
+
+def _clean_gamelog(df):
+    cols_final = [c for c in GAMELOG_COLUMNS if c in df.columns]
+    df_clean = df[cols_final].copy()
+    df_clean.columns = df_clean.columns.str.lower()
+    return _add_matchup_columns(df_clean)
+
+def _create_player_indexes(conn):
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_player_name ON player(player_name);')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_team ON player(team_abbreviation);')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_game_date ON player(game_date);')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_player_name_date ON player(player_name, game_date);')
+    conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_player_game ON player(game_id, player_id);')
+    # H2H por igualdad: (equipo, rival) en el análisis de partido y (jugador, rival) en la ficha
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_team_opponent ON player(team_abbreviation, opponent_abbreviation, game_date);')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_player_opponent ON player(player_name, opponent_abbreviation);')
+
+def download_data(seasons=None, progress_callback=None, incremental=False,
+                  season_types=('Regular Season',), max_workers=NBA_MAX_WORKERS,
+                  min_interval=NBA_MIN_INTERVAL, max_tries=NBA_MAX_TRIES):
+    """
+    Descarga los game logs de jugadores en paralelo (un trozo por temporada y tipo),
+    respetando `min_interval` segundos entre peticiones y reintentando cada trozo.
+    - Completo: cada trozo se vuelca en una tabla de staging que sustituye a `player` al final.
+    - Incremental: por temporada pide solo las fechas desde la última sincronizada
+      (date_from) y hace upsert de cada trozo en `player` por (game_id, player_id).
+    Al final recalcula los agregados por jugador y por equipo-partido (aggregates.py)
+    y el impacto de bajas (analysis.py).
+    Devuelve True si se han escrito filas nuevas o corregidas.
+    """
     if seasons is None:
         seasons = ['2024-25', '2025-26']
-    all_seasons_data = []
-    for i, season in enumerate(seasons):
-        try:
-            gamelogs = leaguegamelog.LeagueGameLog(season=season, player_or_team_abbreviation='P')
-            df = gamelogs.get_data_frames()[0]
+
+    conn = get_write_connection()
+    if incremental and not _player_table_ready(conn):
+        incremental = False
+    sync_state = _get_sync_state(conn)
+    if not incremental:
+        sync_state = {}
+        conn.execute('DROP TABLE IF EXISTS player_staging;')
+
+    marks = {season: sync_state.get(season, (None, None))[0] for season in seasons}
+    chunks = [(season, season_type) for season in seasons for season_type in season_types]
+    limiter = RateLimiter(min_interval)
+
+    all_chunks = []
+    new_marks = {season: mark for season, mark in marks.items() if mark}
+    failed_seasons = set()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {}
+        for season, season_type in chunks:
+            mark = marks[season]
+            # Se vuelve a pedir la propia fecha del mark: puede haber partidos que acabaron después
+            date_from = datetime.strptime(mark, '%Y-%m-%d').strftime('%m/%d/%Y') if mark else None
+            future = executor.submit(_fetch_gamelog_chunk, season, season_type, date_from, limiter, max_tries)
+            futures[future] = (season, season_type)
+
+        for done, future in enumerate(as_completed(futures), start=1):
+            season, season_type = futures[future]
+            try:
+                df = future.result()
+            except Exception as e:
+                failed_seasons.add(season)
+                st.error(f"Error descargando temporada {season} ({season_type}): {e}")
+                continue
             if not df.empty:
-                all_seasons_data.append(df)
+                # Volcado inmediato de cada trozo según llega
+                df_clean = _clean_gamelog(df)
+                if incremental:
+                    # Solo siguen adelante las filas nuevas o corregidas (la fecha del mark se repite)
+                    df_clean = _upsert_player_rows(conn, df_clean)
+                else:
+                    df_clean.to_sql('player_staging', conn, if_exists='append', index=False)
+                conn.commit()
+                if not df_clean.empty:
+                    all_chunks.append(df_clean)
+                new_marks[season] = max(filter(None, [new_marks.get(season), str(df['GAME_DATE'].max())[:10]]))
             if progress_callback:
-                progress_callback((i + 1) * (100 // len(seasons)))
-        except Exception as e:
-            st.error(f"Error descargando temporada {season}: {e}")
-
-    if all_seasons_data:
-        full_df = pd.concat(all_seasons_data, ignore_index=True)
-        cols_needed = ['PLAYER_ID', 'PLAYER_NAME', 'TEAM_ABBREVIATION', 'GAME_DATE', 'MATCHUP',
-                       'PTS', 'REB', 'AST', 'FG3M', 'FGM', 'FGA', 'FG_PCT', 'FG3A', 'FTM', 'FTA',
-                       'OREB', 'DREB', 'STL', 'BLK', 'TOV', 'MIN', 'WL', 'GAME_ID']
-        cols_final = [c for c in cols_needed if c in full_df.columns]
-        df_clean = full_df[cols_final].copy()
-        df_clean.columns = df_clean.columns.str.lower()
-        os.makedirs(CSV_FOLDER, exist_ok=True)
-        df_clean.to_csv(f'{CSV_FOLDER}/player_stats.csv', index=False)
-
-        conn = sqlite3.connect(DB_PATH)
-        df_clean.to_sql('player', conn, if_exists='replace', index=False)
-        conn.execute('CREATE INDEX IF NOT EXISTS idx_player_name ON player(player_name);')
-        conn.execute('CREATE INDEX IF NOT EXISTS idx_team ON player(team_abbreviation);')
-        conn.execute('CREATE INDEX IF NOT EXISTS idx_game_date ON player(game_date);')
-        conn.close()
-        return True
-    return False
+                progress_callback(int(done * 100 / len(chunks)))
+
+    # Sin filas nuevas ni cambiadas no se toca el almacén (ni data_version) ni los agregados
+    written = bool(all_chunks)
+    if all_chunks:
+        df_clean = pd.concat(all_chunks, ignore_index=True)
+        if incremental:
+            _merge_into_store(df_clean)
+        else:
+            _write_store(df_clean)
+            conn.execute('DROP TABLE IF EXISTS player;')
+            conn.execute('ALTER TABLE player_staging RENAME TO player;')
+            conn.execute('DELETE FROM sync_state;')
+        _create_player_indexes(conn)
+        # Agregados por jugador: en incremental solo se rehacen los jugadores con partidos nuevos
+        refresh_player_aggregates(conn, df_clean['player_name'].unique().tolist() if incremental else None)
+        refresh_team_games(conn, df_clean['game_id'].unique().tolist() if incremental else None)
+        # Las medias cambian a toda la liga: el impacto de bajas se rehace completo
+        refresh_absence_impact(conn)
+    elif not incremental:
+        conn.execute('DROP TABLE IF EXISTS player_staging;')
 
-def query_player_stats(player_name=None, team=None, start_date=None, end_date=None):
+    synced_seasons = [season for season in seasons if season not in failed_seasons]
+    if written or incremental:
+        synced_at = datetime.now().isoformat(timespec='seconds')
+        conn.executemany(
+            'INSERT OR REPLACE INTO sync_state (season, last_game_date, synced_at) VALUES (?, ?, ?)',
+            [(season, new_marks.get(season), synced_at) for season in synced_seasons]
+        )
+    conn.commit()
+    conn.close()
+    reset_pool()
+    return written
+
+def query_player_stats(player_name=None, team=None, start_date=None, end_date=None, columns=None, opponent=None):
+    """
+    Consulta game logs en SQLite con una conexión de solo lectura del pool.
+    `columns` limita las columnas devueltas (por defecto todas).
+    """
     if not os.path.exists(DB_PATH):
         return pd.DataFrame()
-    conn = sqlite3.connect(DB_PATH)
-    query = "SELECT * FROM player WHERE 1=1"
+    select = "*"
+    if columns:
+        valid = [c for c in columns if c in table_columns('player')]
+        if valid:
+            select = ", ".join(valid)
+    query = f"SELECT {select} FROM player WHERE 1=1"
     params = []
     if player_name:
         query += " AND player_name = ?"
@@ -76,134 +377,342 @@ def query_player_stats(player_name=None, team=None, start_date=None, end_date=No
     if team:
         query += " AND team_abbreviation = ?"
         params.append(team)
+    if opponent:
+        query += " AND opponent_abbreviation = ?"
+        params.append(opponent)
     if start_date:
         query += " AND game_date >= ?"
         params.append(start_date)
     if end_date:
         query += " AND game_date <= ?"
         params.append(end_date)
-    df = pd.read_sql_query(query, conn, params=params)
-    conn.close()
+    df = read_sql(query, params)
     if 'game_date' in df.columns:
         df['game_date'] = pd.to_datetime(df['game_date'])
     return df
 
+ROSTER_TTL = 86400
+ROSTER_NEGATIVE_TTL = 900
+
+_roster_lock = threading.Lock()
+_roster_state = {'table': None, 'fetched_at': 0.0, 'prefetching': False, 'attempted_at': 0.0}
+_roster_cache = {}  # team_id -> (caduca_en, {jugador: dorsal}); también guarda fallos ({}) con TTL corto
+
+def _fetch_team_roster(team_id, limiter=None):
+    if limiter:
+        limiter.wait()
+    roster = commonteamroster.CommonTeamRoster(team_id=team_id)
+    df_roster = roster.get_data_frames()[0]
+    return pd.DataFrame({
+        'team_id': team_id,
+        'player': df_roster['PLAYER'],
+        'num': df_roster['NUM'].astype(str).str.replace('.0', '', regex=False)
+    })
+
+def refresh_league_rosters(max_workers=NBA_MAX_WORKERS, min_interval=NBA_MIN_INTERVAL):
+    """Descarga los 30 rosters con concurrencia acotada y los guarda en la tabla `roster`."""
+    limiter = RateLimiter(min_interval)
+    frames = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(_fetch_team_roster, team_id, limiter)
+                   for team_id in _team_ids_by_abbreviation().values()]
+        for future in as_completed(futures):
+            try:
+                frames.append(future.result())
+            except Exception as e:
+                print(f"Error descargando roster: {e}")
+    if not frames:
+        return None
+    table = pd.concat(frames, ignore_index=True)
+    table['fetched_at'] = datetime.now().isoformat(timespec='seconds')
+    conn = get_write_connection()
+    table.to_sql('roster', conn, if_exists='replace', index=False)
+    conn.commit()
+    conn.close()
+    return table
+
+def _league_roster_table():
+    """Tabla de dorsales de toda la liga (memoria → SQLite). None si no hay una con menos de un día."""
+    with _roster_lock:
+        if _roster_state['table'] is not None and time.time() - _roster_state['fetched_at'] < ROSTER_TTL:
+            return _roster_state['table']
+    try:
+        table = read_sql('SELECT team_id, player, num, fetched_at FROM roster')
+    except Exception:
+        return None
+    if table.empty:
+        return None
+    fetched_at = datetime.fromisoformat(table['fetched_at'].max()).timestamp()
+    if time.time() - fetched_at >= ROSTER_TTL:
+        return None
+    with _roster_lock:
+        _roster_state['table'] = table
+        _roster_state['fetched_at'] = fetched_at
+    return table
+
+def prefetch_league_rosters():
+    """Refresca en segundo plano la tabla de dorsales si falta o tiene más de un día. No bloquea."""
+    if _league_roster_table() is not None:
+        return
+    with _roster_lock:
+        if _roster_state['prefetching'] or time.time() - _roster_state['attempted_at'] < ROSTER_NEGATIVE_TTL:
+            return
+        _roster_state['prefetching'] = True
+        _roster_state['attempted_at'] = time.time()
+
+    def worker():
+        try:
+            table = refresh_league_rosters()
+            if table is not None:
+                with _roster_lock:
+                    _roster_state['table'] = table
+                    _roster_state['fetched_at'] = time.time()
+        finally:
+            with _roster_lock:
+                _roster_state['prefetching'] = False
+
+    threading.Thread(target=worker, daemon=True, name="roster-prefetch").start()
+
 def get_team_roster_numbers(team_id):
+    """Dorsales {jugador: número} de un equipo: tabla de liga si está fresca; si no, petición individual cacheada."""
+    table = _league_roster_table()
+    if table is not None:
+        team_rows = table[table['team_id'] == team_id]
+        if not team_rows.empty:
+            return dict(zip(team_rows['player'], team_rows['num']))
+
+    cached = _roster_cache.get(team_id)
+    if cached and cached[0] > time.time():
+        return cached[1]
     try:
-        roster = commonteamroster.CommonTeamRoster(team_id=team_id)
-        df_roster = roster.get_data_frames()[0]
-        df_roster['NUM'] = df_roster['NUM'].astype(str).str.replace('.0', '', regex=False)
-        return dict(zip(df_roster['PLAYER'], df_roster['NUM']))
-    except:
-        return {}
+        df_roster = _fetch_team_roster(team_id)
+        numbers = dict(zip(df_roster['player'], df_roster['num']))
+        _roster_cache[team_id] = (time.time() + ROSTER_TTL, numbers)
+    except Exception:
+        numbers = {}
+        _roster_cache[team_id] = (time.time() + ROSTER_NEGATIVE_TTL, numbers)
+    return numbers
 
 @backoff.on_exception(backoff.expo, requests.exceptions.RequestException, max_tries=3)
-def safe_get(url, timeout=5):
-    return requests.get(url, timeout=timeout)
+def safe_get(url, timeout=5, headers=None):
+    return requests.get(url, timeout=timeout, headers=headers)
 
-def get_next_matchup_info(t1_abv, t2_abv):
+SCHEDULE_URL = "https://cdn.nba.com/static/json/staticData/scheduleLeagueV2.json"
+SCHEDULE_CACHE_FILE = "schedule_cache.json"
+SCHEDULE_TTL = 3600
+
+@lru_cache(maxsize=1)
+def _team_ids_by_abbreviation():
+    return {t['abbreviation']: t['id'] for t in nba_static_teams.get_teams()}
+
+def _fetch_schedule():
+    """
+    Descarga el calendario con revalidación condicional (ETag / If-Modified-Since)
+    y lo persiste en disco. Si no ha cambiado (304) o falla la red, usa la copia local.
+    """
+    cached = None
+    if os.path.exists(SCHEDULE_CACHE_FILE):
+        try:
+            with open(SCHEDULE_CACHE_FILE, 'r') as f:
+                cached = json.load(f)
+        except Exception:
+            cached = None
+
+    headers = {}
+    if cached:
+        if cached.get('etag'):
+            headers['If-None-Match'] = cached['etag']
+        if cached.get('last_modified'):
+            headers['If-Modified-Since'] = cached['last_modified']
+
+    try:
+        response = safe_get(SCHEDULE_URL, timeout=5, headers=headers)
+    except Exception:
+        return cached['data'] if cached else None
+    if response.status_code == 304 and cached:
+        return cached['data']
+    if response.status_code != 200:
+        return cached['data'] if cached else None
+
+    data = response.json()
+    tmp_path = f"{SCHEDULE_CACHE_FILE}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'data': data
+        }, f)
+    os.replace(tmp_path, SCHEDULE_CACHE_FILE)
+    return data
+
+@st.cache_resource(ttl=SCHEDULE_TTL, show_spinner=False)
+def _build_schedule_index():
+    # cache_resource: el índice es de solo lectura y se comparte sin copiarlo en cada consulta.
+    # Si no hay calendario se lanza la excepción para que el fallo no quede cacheado.
+    data = _fetch_schedule()
+    if not data:
+        raise RuntimeError("Calendario no disponible")
+    pairs, dates = {}, {}
+    for day in data.get('leagueSchedule', {}).get('gameDates', []):
+        try:
+            game_dt = datetime.strptime(day['gameDate'], "%m/%d/%Y %H:%M:%S").date()
+        except Exception:
+            continue
+        for game in day.get('games', []):
+            h_id = game['homeTeam']['teamId']
+            v_id = game['awayTeam']['teamId']
+            pairs.setdefault(tuple(sorted((h_id, v_id))), []).append((game_dt, h_id, v_id, game['gameId']))
+            dates.setdefault(game_dt, []).append((h_id, v_id, game['gameId']))
+    for games in pairs.values():
+        games.sort()
+    return {'pairs': pairs, 'dates': dates}
+
+def get_schedule_index():
+    """
+    Índices del calendario (None si no se ha podido descargar):
+    - 'pairs': {(id_a, id_b) ordenado: [(fecha, home_id, away_id, game_id), ...] por fecha}
+    - 'dates': {fecha: [(home_id, away_id, game_id), ...]}
+    """
     try:
-        response = safe_get("https://cdn.nba.com/static/json/staticData/scheduleLeagueV2.json", timeout=5)
-        data = response.json()
-        dates = data['leagueSchedule']['gameDates']
-    except:
+        return _build_schedule_index()
+    except Exception:
         return None
 
-    nba_teams = nba_static_teams.get_teams()
-    team_map = {t['abbreviation']: t['id'] for t in nba_teams}
+def get_next_matchup_info(t1_abv, t2_abv):
+    index = get_schedule_index()
+    if not index:
+        return None
+
+    team_map = _team_ids_by_abbreviation()
     id1 = team_map.get(t1_abv)
     id2 = team_map.get(t2_abv)
     if not id1 or not id2:
         return None
 
     today = datetime.now().date()
-    for day in dates:
-        try:
-            game_dt = datetime.strptime(day['gameDate'], "%m/%d/%Y %H:%M:%S").date()
-            if game_dt < today:
-                continue
-            for game in day['games']:
-                h_id = game['homeTeam']['teamId']
-                v_id = game['awayTeam']['teamId']
-                if (h_id == id1 and v_id == id2) or (h_id == id2 and v_id == id1):
-                    return {
-                        'date': game_dt.strftime("%d/%m/%Y"),
-                        'home': t1_abv if h_id == id1 else t2_abv,
-                        'away': t2_abv if h_id == id1 else t1_abv,
-                        'game_id': game['gameId']
-                    }
-        except:
+    for game_dt, h_id, v_id, game_id in index['pairs'].get(tuple(sorted((id1, id2))), []):
+        if game_dt < today:
             continue
+        return {
+            'date': game_dt.strftime("%d/%m/%Y"),
+            'home': t1_abv if h_id == id1 else t2_abv,
+            'away': t2_abv if h_id == id1 else t1_abv,
+            'game_id': game_id
+        }
     return None
 
+MATCHUP_FETCH_TIMEOUT = 8
+
+def fetch_matchup_context(t1_abv, t2_abv, timeout=MATCHUP_FETCH_TIMEOUT):
+    """
+    Lanza a la vez los rosters de ambos equipos, el próximo enfrentamiento y las lesiones.
+    Devuelve lo que haya llegado en `timeout` segundos; lo demás queda vacío y se indica en 'pending'.
+    """
+    team_map = _team_ids_by_abbreviation()
+    jobs = {
+        'next_game': (get_next_matchup_info, (t1_abv, t2_abv)),
+        'injuries': (get_injuries, ()),
+    }
+    if t1_abv in team_map:
+        jobs['roster_t1'] = (get_team_roster_numbers, (team_map[t1_abv],))
+    if t2_abv in team_map:
+        jobs['roster_t2'] = (get_team_roster_numbers, (team_map[t2_abv],))
+
+    results, pending = run_concurrently(jobs, timeout)
+    return {
+        'roster_t1': results.get('roster_t1', {}),
+        'roster_t2': results.get('roster_t2', {}),
+        'next_game': results.get('next_game'),
+        'injuries': results.get('injuries', []),
+        'pending': pending
+    }
+
+# TTL del marcador según su contenido: en juego, pendientes de hoy, y días cerrados o futuros
+SCOREBOARD_LIVE_TTL = 60
+SCOREBOARD_TODAY_TTL = 300
+SCOREBOARD_FUTURE_TTL = 3600
+SCOREBOARD_FINAL_TTL = 6 * 3600
+SCOREBOARD_ERROR_TTL = 60
+
+_scoreboard_cache = {}  # fecha_str -> (caduca_en, game_header)
+
+def _scoreboard_ttl(games, fecha, today):
+    if games.empty:
+        return SCOREBOARD_FINAL_TTL if fecha < today else SCOREBOARD_FUTURE_TTL
+    status = games['GAME_STATUS_ID']
+    if (status == 2).any():
+        return SCOREBOARD_LIVE_TTL
+    if (status == 3).all():
+        return SCOREBOARD_FINAL_TTL
+    return SCOREBOARD_TODAY_TTL if fecha <= today else SCOREBOARD_FUTURE_TTL
+
+def _get_scoreboard(fecha, today):
+    """game_header del ScoreboardV2 de una fecha, con caché en memoria compartida entre sesiones."""
+    fecha_str = fecha.strftime('%Y-%m-%d')
+    cached = _scoreboard_cache.get(fecha_str)
+    if cached and cached[0] > time.time():
+        return cached[1]
+    try:
+        board = scoreboardv2.ScoreboardV2(game_date=fecha_str)
+        games = board.game_header.get_data_frame()
+        ttl = _scoreboard_ttl(games, fecha, today)
+    except Exception:
+        games = pd.DataFrame()
+        ttl = SCOREBOARD_ERROR_TTL
+    games = games.assign(FECHA_US=fecha_str)
+    _scoreboard_cache[fecha_str] = (time.time() + ttl, games)
+    return games
+
 def obtener_partidos():
-    from nba_api.stats.endpoints import scoreboardv2
-    from nba_api.stats.static import teams as nba_static_teams
-    from utils import get_basketball_date, convertir_hora_espanol
-    
-    nba_teams = nba_static_teams.get_teams()
-    team_map = {t['id']: t['abbreviation'] for t in nba_teams}
+    team_abbr = {team_id: abv for abv, team_id in _team_ids_by_abbreviation().items()}
 
     basket_today_us = get_basketball_date()
     fechas_us = [basket_today_us, basket_today_us + timedelta(days=1)]
 
-    agenda = {}
-    seen_game_ids = set()
+    # Las dos fechas se piden a la vez
+    with ThreadPoolExecutor(max_workers=len(fechas_us)) as executor:
+        frames = list(executor.map(lambda f: _get_scoreboard(f, basket_today_us), fechas_us))
+    frames = [f for f in frames if not f.empty]
+    if not frames:
+        return {}
 
-    for fecha in fechas_us:
-        fecha_str = fecha.strftime('%Y-%m-%d')
-        try:
-            board = scoreboardv2.ScoreboardV2(game_date=fecha_str)
-            games = board.game_header.get_data_frame()
-
-            if not games.empty:
-                for _, game in games.iterrows():
-                    h_id, v_id = game['HOME_TEAM_ID'], game['VISITOR_TEAM_ID']
-                    status_text = game['GAME_STATUS_TEXT']
-                    game_id = game['GAME_ID']
-
-                    # Evitar duplicados: si ya hemos añadido este GAME_ID, lo saltamos
-                    if game_id in seen_game_ids:
-                        continue
-
-                    fecha_juego_dt = datetime.strptime(fecha_str, "%Y-%m-%d")
-                    hora_esp = status_text
-
-                    if "ET" in status_text:
-                        try:
-                            hora_clean = status_text.replace(" ET", "").strip()
-                            dt_us = datetime.strptime(f"{fecha_str} {hora_clean}", "%Y-%m-%d %I:%M %p")
-                            # Ajuste horario: ET+5 para España
-                            dt_es = dt_us + timedelta(hours=5)
-                            fecha_juego_dt = dt_es
-                            hora_esp = dt_es.strftime("%H:%M")
-                        except:
-                            pass
-                    elif "Final" in status_text:
-                        hora_esp = "FINALIZADO"
-
-                    label_real = fecha_juego_dt.strftime("%d/%m")
-
-                    if label_real not in agenda:
-                        agenda[label_real] = []
-
-                    agenda[label_real].append({
-                        'game_id': game_id,
-                        'v_abv': team_map.get(v_id),
-                        'h_abv': team_map.get(h_id),
-                        'v_logo': f"https://cdn.nba.com/logos/nba/{v_id}/global/L/logo.svg",
-                        'h_logo': f"https://cdn.nba.com/logos/nba/{h_id}/global/L/logo.svg",
-                        'time': hora_esp
-                    })
-                    seen_game_ids.add(game_id)
-        except:
-            pass
+    # Evitar duplicados: un mismo GAME_ID puede aparecer en los dos días
+    games = pd.concat(frames, ignore_index=True).drop_duplicates('GAME_ID')
+
+    status = games['GAME_STATUS_TEXT'].astype(str)
+    fecha_us = pd.to_datetime(games['FECHA_US'])
+    is_et = status.str.contains('ET', regex=False)
+    dt_us = pd.to_datetime(
+        games['FECHA_US'] + ' ' + status.str.replace(' ET', '', regex=False).str.strip(),
+        format='%Y-%m-%d %I:%M %p',
+        errors='coerce'
+    )
+    # Ajuste horario: ET+5 para España
+    dt_es = dt_us + pd.Timedelta(hours=5)
+    parsed = is_et & dt_es.notna()
+
+    hora_esp = status.mask(~is_et & status.str.contains('Final', regex=False), 'FINALIZADO')
+    hora_esp = hora_esp.mask(parsed, dt_es.dt.strftime('%H:%M'))
+    fecha_juego = dt_es.where(parsed, fecha_us)
+
+    v_id = games['VISITOR_TEAM_ID']
+    h_id = games['HOME_TEAM_ID']
+    rows = pd.DataFrame({
+        'label': fecha_juego.dt.strftime('%d/%m'),
+        'fecha': fecha_juego.dt.normalize(),
+        'game_id': games['GAME_ID'],
+        'v_abv': v_id.map(team_abbr).astype(object).where(v_id.map(team_abbr).notna(), None),
+        'h_abv': h_id.map(team_abbr).astype(object).where(h_id.map(team_abbr).notna(), None),
+        'v_logo': "https://cdn.nba.com/logos/nba/" + v_id.astype(str) + "/global/L/logo.svg",
+        'h_logo': "https://cdn.nba.com/logos/nba/" + h_id.astype(str) + "/global/L/logo.svg",
+        'time': hora_esp
+    })
 
-    keys_ordenadas = sorted(agenda.keys(), key=lambda x: datetime.strptime(x, "%d/%m").replace(year=datetime.now().year))
-    agenda_ordenada = {k: agenda[k] for k in keys_ordenadas}
-    return agenda_ordenada
+    keys_ordenadas = rows.groupby('label', sort=False)['fecha'].min().sort_values(kind='stable').index
+    grouped = rows.drop(columns='fecha').groupby('label', sort=False)
+    return {k: grouped.get_group(k).drop(columns='label').to_dict('records') for k in keys_ordenadas}
 
-@st.cache_data(ttl=21600)
+@st.cache_data(ttl=21600, show_spinner=False)
 def get_injuries():
     """
     Scrapea lesiones desde CBSSports (más confiable que ESPN)
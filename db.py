@@ -0,0 +1,81 @@
+import sqlite3
+import os
+import queue
+import threading
+from contextlib import contextmanager
+import pandas as pd
+
+DB_PATH = "nba.sqlite"
+
+# Lectura: conexiones de solo lectura reutilizadas entre reruns y sesiones de Streamlit
+POOL_SIZE = 8
+MMAP_SIZE = 256 * 1024 * 1024
+STATEMENT_CACHE = 128
+
+_pool = queue.LifoQueue(maxsize=POOL_SIZE)
+_pool_lock = threading.Lock()
+_columns_cache = {}
+
+def _open_read_connection():
+    conn = sqlite3.connect(
+        f"file:{DB_PATH}?mode=ro",
+        uri=True,
+        check_same_thread=False,
+        cached_statements=STATEMENT_CACHE
+    )
+    conn.execute(f"PRAGMA mmap_size={MMAP_SIZE};")
+    conn.execute("PRAGMA query_only=1;")
+    return conn
+
+@contextmanager
+def read_connection():
+    """
+    Presta una conexión de solo lectura al hilo actual mientras dura el bloque.
+    Streamlit lanza un hilo nuevo por rerun, así que las conexiones viven en el pool
+    (no en thread-locals) para poder reutilizarlas.
+    """
+    try:
+        conn = _pool.get_nowait()
+    except queue.Empty:
+        conn = _open_read_connection()
+    try:
+        yield conn
+    finally:
+        try:
+            _pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+def get_write_connection():
+    """Conexión de escritura en modo WAL: las lecturas no se bloquean durante una sincronización."""
+    conn = sqlite3.connect(DB_PATH)
+    conn.execute("PRAGMA journal_mode=WAL;")
+    conn.execute("PRAGMA synchronous=NORMAL;")
+    return conn
+
+def reset_pool():
+    """Cierra las conexiones del pool (p. ej. tras recrear el fichero de la base)."""
+    with _pool_lock:
+        _columns_cache.clear()
+        while True:
+            try:
+                _pool.get_nowait().close()
+            except queue.Empty:
+                break
+
+def table_columns(table):
+    """Columnas de una tabla (cacheadas; sirven para validar proyecciones)."""
+    if table not in _columns_cache:
+        with read_connection() as conn:
+            cols = [r[1] for r in conn.execute(f"PRAGMA table_info({table})")]
+        if not cols:
+            return []
+        _columns_cache[table] = cols
+    return _columns_cache[table]
+
+def read_sql(query, params=()):
+    """Ejecuta una consulta de lectura con una conexión del pool. Vacío si la base no existe."""
+    if not os.path.exists(DB_PATH):
+        return pd.DataFrame()
+    with read_connection() as conn:
+        return pd.read_sql_query(query, conn, params=list(params))
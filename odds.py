@@ -2,27 +2,56 @@ import streamlit as st
 import requests
 import json
 import os
-from datetime import datetime
+import sqlite3
+import zlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from datetime import datetime, timedelta, timezone
 import backoff
+import pandas as pd
 
-ODDS_CACHE_FILE = "odds_cache.json"
+ODDS_CACHE_FILE = "odds_cache.json"  # formato antiguo: se migra al histórico
+ODDS_DB_PATH = "odds.sqlite"
 
-@backoff.on_exception(backoff.expo, requests.exceptions.RequestException, max_tries=3)
-def get_sports_odds(api_key, market_key):
-    """Obtiene cuotas de TheOddsAPI con manejo de errores y regiones adecuadas."""
-    region = 'eu' if market_key != 'player_points' else 'us'
+# Histórico de capturas: se guarda todo durante COMPACT_AFTER_HOURS, luego una por hora
+ODDS_RETENTION_DAYS = 14
+ODDS_COMPACT_AFTER_HOURS = 24
+
+ODDS_API_URL = 'https://api.the-odds-api.com/v4/sports/basketball_nba'
+BOARD_MARKETS = ['h2h', 'spreads', 'totals', 'player_points']
+EVENT_WORKERS = 4  # peticiones de props por partido en paralelo
+
+def market_region(market_key):
+    """Región de casas de apuestas que se consulta para cada mercado (props solo en EE. UU.)."""
+    return 'us' if market_key.startswith('player_') else 'eu'
+
+# Programador de descargas: cada llamada gasta créditos (mercados × regiones)
+ODDS_MIN_REFRESH_SECONDS = 120  # clics de varias sesiones dentro de este margen comparten la captura
+ODDS_WINDOW_HOURS = 36          # solo se piden partidos que empiezan antes de este margen
+QUOTA_RESERVE = 10              # créditos que no se gastan desde la app
+QUOTA_STALE_HOURS = 24          # una cuota guardada más antigua (o de otro mes) ya no bloquea
+
+_fetch_locks = {}
+_fetch_locks_guard = threading.Lock()
+
+def _fetch_lock(key):
+    with _fetch_locks_guard:
+        return _fetch_locks.setdefault(key, threading.Lock())
+
+def _as_list(values):
+    return [values] if isinstance(values, str) else list(values)
+
+@backoff.on_exception(backoff.expo, requests.exceptions.ConnectionError, max_tries=2)
+def _request(path, params):
+    # Solo se reintenta si la petición no llegó al servidor: un timeout puede haberse cobrado
+    return requests.get(f'{ODDS_API_URL}/{path}', params=params, timeout=10)
+
+def _api_get(path, params):
+    """GET a TheOddsAPI: devuelve (json, error) y guarda los créditos de las cabeceras."""
     try:
-        odds_response = requests.get(
-            f'https://api.the-odds-api.com/v4/sports/basketball_nba/odds',
-            params={
-                'api_key': api_key,
-                'regions': region,
-                'markets': market_key,
-                'oddsFormat': 'decimal',
-                'dateFormat': 'iso',
-            },
-            timeout=10
-        )
+        odds_response = _request(path, params)
+        _save_quota(odds_response.headers)
         if odds_response.status_code != 200:
             if odds_response.status_code == 422:
                 return None, "Error 422: Tu plan gratuito no soporta este mercado o región. Prueba 'Ganador Partido'."
@@ -33,73 +62,430 @@ def get_sports_odds(api_key, market_key):
     except Exception as e:
         return None, str(e)
 
-def save_cache(data, market_type):
-    """Guarda los datos de cuotas en caché con timestamp."""
-    cache = {
-        "timestamp": datetime.now().strftime("%d/%m/%Y %H:%M:%S"),
-        "market": market_type,
-        "data": data
+def _odds_params(api_key, markets, regions, commence_to=None):
+    markets = _as_list(markets)
+    regions = _as_list(regions) if regions else sorted({market_region(m) for m in markets})
+    params = {
+        'api_key': api_key,
+        'regions': ','.join(regions),
+        'markets': ','.join(markets),
+        'oddsFormat': 'decimal',
+        'dateFormat': 'iso',
     }
-    with open(ODDS_CACHE_FILE, 'w') as f:
-        json.dump(cache, f)
+    if commence_to is not None:
+        params['commenceTimeTo'] = commence_to.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+    return params
+
+def get_sports_odds(api_key, markets, regions=None, commence_to=None):
+    """
+    Cuotas de todos los partidos para uno o varios mercados principales (h2h, spreads, totals)
+    en una sola llamada. Por defecto se consulta la región de cada mercado.
+    `commence_to` limita la respuesta a partidos que empiezan antes de esa fecha.
+    """
+    return _api_get('odds', _odds_params(api_key, markets, regions, commence_to))
+
+def get_events(api_key, commence_to=None):
+    """Partidos programados (este endpoint no gasta créditos)."""
+    params = {'api_key': api_key, 'dateFormat': 'iso'}
+    if commence_to is not None:
+        params['commenceTimeTo'] = commence_to.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+    return _api_get('events', params)
+
+def get_event_odds(api_key, event_id, markets, regions=None):
+    """Cuotas de un partido: el único endpoint que sirve los props de jugador."""
+    return _api_get(f'events/{event_id}/odds', _odds_params(api_key, markets, regions))
+
+def _merge_games(payloads):
+    """Une varias respuestas en una lista de partidos, juntando casas y mercados por partido."""
+    games = {}
+    for payload in payloads:
+        for game in payload or []:
+            merged = games.setdefault(game.get('id'), {**game, 'bookmakers': []})
+            books = {bm.get('key'): bm for bm in merged['bookmakers']}
+            for bm in game.get('bookmakers', []):
+                if bm.get('key') in books:
+                    books[bm['key']]['markets'] = books[bm['key']]['markets'] + bm.get('markets', [])
+                else:
+                    merged['bookmakers'].append({**bm, 'markets': list(bm.get('markets', []))})
+    return list(games.values())
+
+def get_board_odds(api_key, markets, commence_to=None):
+    """
+    Todos los mercados pedidos con el mínimo de llamadas: una a /odds para los principales y,
+    para los props, una por partido a /events/{id}/odds en paralelo. Devuelve (partidos, error).
+    """
+    markets = _as_list(markets)
+    featured = [m for m in markets if not m.startswith('player_')]
+    props = [m for m in markets if m.startswith('player_')]
+    payloads = []
+    if featured:
+        odds_data, error = get_sports_odds(api_key, featured, commence_to=commence_to)
+        if error:
+            return None, error
+        payloads.append(odds_data)
+    if props:
+        events, error = get_events(api_key, commence_to=commence_to)
+        if error:
+            return None, error
+        ids = [e['id'] for e in events or [] if e.get('id')]
+        with ThreadPoolExecutor(max_workers=EVENT_WORKERS) as executor:
+            results = list(executor.map(lambda event_id: get_event_odds(api_key, event_id, props), ids))
+        if results and not any(data for data, _ in results):
+            return None, next((err for _, err in results if err), None)
+        payloads.append([data for data, _ in results if data])
+    return _merge_games(payloads), None
+
+def _market_games(odds_data, market_key):
+    """Partidos de `odds_data` con solo las cuotas de `market_key` (formato de una captura)."""
+    games = []
+    for game in odds_data:
+        books = [{**bm, 'markets': [m for m in bm.get('markets', []) if m.get('key') == market_key]}
+                 for bm in game.get('bookmakers', [])]
+        books = [bm for bm in books if bm['markets']]
+        if books:
+            games.append({**game, 'bookmakers': books})
+    return games
+
+def _save_quota(headers):
+    """Guarda los créditos de las cabeceras. Si falla solo se registra: la respuesta ya está pagada."""
+    remaining, used = headers.get('x-requests-remaining'), headers.get('x-requests-used')
+    if remaining is None:
+        return
+    try:
+        conn = _connect()
+        try:
+            conn.execute('INSERT OR REPLACE INTO odds_quota (id, remaining, used, updated_at) VALUES (1, ?, ?, ?)',
+                         (int(float(remaining)), int(float(used or 0)), _iso(datetime.now(timezone.utc))))
+            conn.commit()
+        finally:
+            conn.close()
+    except Exception as e:
+        print(f"Error guardando la cuota de la API: {e}")
 
-def load_cache():
-    """Carga la caché de cuotas si existe."""
-    if os.path.exists(ODDS_CACHE_FILE):
+def get_quota():
+    """Últimos créditos conocidos de TheOddsAPI: {'remaining', 'used', 'updated_at'} o None."""
+    if not os.path.exists(ODDS_DB_PATH):
+        return None
+    try:
+        conn = _connect()
         try:
-            with open(ODDS_CACHE_FILE, 'r') as f:
-                return json.load(f)
-        except:
+            row = conn.execute('SELECT remaining, used, updated_at FROM odds_quota WHERE id = 1').fetchone()
+        finally:
+            conn.close()
+    except Exception:
+        return None
+    return dict(zip(('remaining', 'used', 'updated_at'), row)) if row else None
+
+def _blocking_quota(api_key, now):
+    """
+    Cuota guardada si impide descargar (menos de QUOTA_RESERVE créditos), o None.
+    Antes de bloquear se relee con /events (gratis), porque los créditos se renuevan cada mes;
+    si no se puede releer, una cuota antigua o de otro mes no bloquea.
+    """
+    quota = get_quota()
+    if not quota or quota['remaining'] is None or quota['remaining'] >= QUOTA_RESERVE:
+        return None
+    get_events(api_key)
+    quota = get_quota()
+    if quota['remaining'] >= QUOTA_RESERVE:
+        return None
+    updated = datetime.fromisoformat(quota['updated_at'])
+    if now - updated > timedelta(hours=QUOTA_STALE_HOURS) or (updated.year, updated.month) != (now.year, now.month):
+        return None
+    return quota
+
+def _commence(game):
+    try:
+        return datetime.fromisoformat(game['commence_time'].replace('Z', '+00:00'))
+    except (KeyError, AttributeError, ValueError):
+        return None
+
+def refresh_odds(api_key, markets):
+    """
+    Descarga y guarda capturas nuevas de uno o varios mercados respetando los créditos de la API.
+    Devuelve (estado, mensaje) con estado 'ok', 'recent' (otra sesión acaba de descargarlos),
+    'empty', 'quota' o 'error'. Los partidos fuera de la ventana se copian de la captura anterior.
+    """
+    markets = sorted(set(_as_list(markets)))
+    with ExitStack() as stack:
+        # Mismo orden de bloqueo en todas las sesiones: sin interbloqueos
+        for market_key in markets:
+            stack.enter_context(_fetch_lock((market_key, market_region(market_key))))
+        now = datetime.now(timezone.utc)
+        latest = {m: latest_snapshot_info(m) for m in markets}
+        stale = [m for m in markets if not latest[m] or
+                 (now - datetime.fromisoformat(latest[m]['fetched_at'])).total_seconds() >= ODDS_MIN_REFRESH_SECONDS]
+        if not stale:
+            return 'recent', None
+        quota = _blocking_quota(api_key, now)
+        if quota:
+            return 'quota', f"Cuota de la API casi agotada (quedan {quota['remaining']} créditos). Se muestran los datos guardados."
+
+        window_end = now + timedelta(hours=ODDS_WINDOW_HOURS)
+        odds_data, error = get_board_odds(api_key, stale, commence_to=window_end)
+        if error:
+            return 'error', error
+        odds_data = odds_data or []
+        fetched = {g.get('id') for g in odds_data}
+        saved = False
+        for market_key in stale:
+            games = _market_games(odds_data, market_key)
+            previous = load_latest_snapshot(market_key) if latest[market_key] else None
+            later = [g for g in (previous['data'] if previous else [])
+                     if g.get('id') not in fetched and (_commence(g) or now) > window_end]
+            if games or later:
+                save_snapshot(games + later, market_key, fetched_at=now)
+                saved = True
+        return ('ok' if saved else 'empty'), None
+
+def _connect():
+    conn = sqlite3.connect(ODDS_DB_PATH)
+    conn.execute("PRAGMA journal_mode=WAL;")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS odds_snapshot (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            market TEXT NOT NULL,
+            region TEXT NOT NULL,
+            fetched_at TEXT NOT NULL,
+            payload BLOB NOT NULL
+        );
+    """)
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_odds_latest ON odds_snapshot(market, region, fetched_at);')
+    conn.execute('CREATE TABLE IF NOT EXISTS odds_quota (id INTEGER PRIMARY KEY, remaining INTEGER, used INTEGER, updated_at TEXT);')
+    return conn
+
+def _iso(moment):
+    return moment.astimezone(timezone.utc).isoformat(timespec='seconds')
+
+def _encode(data):
+    return zlib.compress(json.dumps(data, separators=(',', ':')).encode('utf-8'))
+
+def _decode(payload):
+    return json.loads(zlib.decompress(payload).decode('utf-8'))
+
+def _snapshot(market, region, fetched_at, payload):
+    return {
+        "timestamp": datetime.fromisoformat(fetched_at).astimezone().strftime("%d/%m/%Y %H:%M:%S"),
+        "market": market,
+        "region": region,
+        "fetched_at": fetched_at,
+        "data": _decode(payload)
+    }
+
+def _apply_retention(conn, now):
+    """
+    Borra capturas más antiguas que la retención y deja una por hora pasadas COMPACT_AFTER_HOURS.
+    La última de cada mercado se conserva siempre.
+    """
+    conn.execute("""
+        DELETE FROM odds_snapshot WHERE fetched_at < ? AND id NOT IN (
+            SELECT MAX(id) FROM odds_snapshot GROUP BY market, region
+        )
+    """, (_iso(now - timedelta(days=ODDS_RETENTION_DAYS)),))
+    compact_before = _iso(now - timedelta(hours=ODDS_COMPACT_AFTER_HOURS))
+    conn.execute("""
+        DELETE FROM odds_snapshot WHERE fetched_at < ? AND id NOT IN (
+            SELECT MAX(id) FROM odds_snapshot WHERE fetched_at < ?
+            GROUP BY market, region, substr(fetched_at, 1, 13)
+        )
+    """, (compact_before, compact_before))
+
+def save_snapshot(data, market_key, region=None, fetched_at=None):
+    """Añade una captura de cuotas (JSON comprimido) al histórico y aplica la retención."""
+    region = region or market_region(market_key)
+    now = datetime.now(timezone.utc)
+    fetched_at = fetched_at or now
+    conn = _connect()
+    try:
+        conn.execute('INSERT INTO odds_snapshot (market, region, fetched_at, payload) VALUES (?, ?, ?, ?)',
+                     (market_key, region, _iso(fetched_at), _encode(data)))
+        _apply_retention(conn, now)
+        conn.commit()
+    finally:
+        conn.close()
+
+def load_latest_snapshot(market_key, region=None):
+    """Última captura guardada del mercado (dict con timestamp y data) o None."""
+    region = region or market_region(market_key)
+    try:
+        _migrate_json_cache()
+        if not os.path.exists(ODDS_DB_PATH):
             return None
-    return None
+        conn = _connect()
+        try:
+            row = conn.execute("""
+                SELECT fetched_at, payload FROM odds_snapshot WHERE market = ? AND region = ?
+                ORDER BY fetched_at DESC LIMIT 1
+            """, (market_key, region)).fetchone()
+        finally:
+            conn.close()
+    except Exception:
+        return None
+    return _snapshot(market_key, region, *row) if row else None
 
-def detect_value_odds(odds_data, market_key='h2h', threshold=0.10):
+def latest_snapshot_info(market_key, region=None):
+    """Fecha de la última captura del mercado (sin descomprimirla) o None."""
+    region = region or market_region(market_key)
+    try:
+        _migrate_json_cache()
+        if not os.path.exists(ODDS_DB_PATH):
+            return None
+        conn = _connect()
+        try:
+            row = conn.execute('SELECT MAX(fetched_at) FROM odds_snapshot WHERE market = ? AND region = ?',
+                               (market_key, region)).fetchone()
+        finally:
+            conn.close()
+    except Exception:
+        return None
+    if not row or row[0] is None:
+        return None
+    return {
+        "timestamp": datetime.fromisoformat(row[0]).astimezone().strftime("%d/%m/%Y %H:%M:%S"),
+        "market": market_key,
+        "region": region,
+        "fetched_at": row[0]
+    }
+
+@st.cache_data(ttl=86400, show_spinner=False)
+def load_odds_table(market_key, region, fetched_at):
     """
-    Detecta cuotas con valor (por encima de la media del mercado en más de un threshold%).
-    Retorna una lista de dicts con la información.
+    Tabla normalizada (`normalize_odds`) de una captura concreta. La clave incluye
+    `fetched_at`, así que se calcula una vez por descarga y no en cada render.
     """
-    if market_key != 'h2h':
+    try:
+        conn = _connect()
+        try:
+            row = conn.execute("""
+                SELECT payload FROM odds_snapshot WHERE market = ? AND region = ? AND fetched_at = ?
+                ORDER BY id DESC LIMIT 1
+            """, (market_key, region, fetched_at)).fetchone()
+        finally:
+            conn.close()
+    except Exception:
+        return normalize_odds([])
+    return normalize_odds(_decode(row[0]) if row else [])
+
+def load_snapshot_history(market_key, region=None, since=None):
+    """Capturas del mercado (de la más antigua a la más reciente) para ver el movimiento de líneas."""
+    if not os.path.exists(ODDS_DB_PATH):
         return []
+    region = region or market_region(market_key)
+    query = 'SELECT fetched_at, payload FROM odds_snapshot WHERE market = ? AND region = ?'
+    params = [market_key, region]
+    if since is not None:
+        query += ' AND fetched_at >= ?'
+        params.append(_iso(since))
+    try:
+        conn = _connect()
+        try:
+            rows = conn.execute(query + ' ORDER BY fetched_at', params).fetchall()
+        finally:
+            conn.close()
+    except Exception:
+        return []
+    return [_snapshot(market_key, region, *row) for row in rows]
 
-    value_odds = []
-    for game in odds_data:
-        home = game['home_team']
-        away = game['away_team']
-        bookmakers = game.get('bookmakers', [])
-        all_home = []
-        all_away = []
-        for bm in bookmakers:
-            markets = bm.get('markets', [])
-            if not markets:
-                continue
-            outcomes = markets[0].get('outcomes', [])
-            o_h = next((x for x in outcomes if x['name'] == home), None)
-            o_a = next((x for x in outcomes if x['name'] == away), None)
-            if o_h and o_a:
-                all_home.append({'bookmaker': bm['title'], 'price': o_h['price']})
-                all_away.append({'bookmaker': bm['title'], 'price': o_a['price']})
-        if all_home:
-            avg_home = sum(x['price'] for x in all_home) / len(all_home)
-            for item in all_home:
-                if item['price'] > avg_home * (1 + threshold):
-                    value_odds.append({
-                        'game': f"{away} @ {home}",
-                        'team': home,
-                        'bookmaker': item['bookmaker'],
-                        'price': item['price'],
-                        'avg': round(avg_home, 2),
-                        'over_percent': round((item['price'] - avg_home) / avg_home * 100, 1)
-                    })
-        if all_away:
-            avg_away = sum(x['price'] for x in all_away) / len(all_away)
-            for item in all_away:
-                if item['price'] > avg_away * (1 + threshold):
-                    value_odds.append({
-                        'game': f"{away} @ {home}",
-                        'team': away,
-                        'bookmaker': item['bookmaker'],
-                        'price': item['price'],
-                        'avg': round(avg_away, 2),
-                        'over_percent': round((item['price'] - avg_away) / avg_away * 100, 1)
-                    })
-    return value_odds
\ No newline at end of file
+def _migrate_json_cache():
+    """Pasa el antiguo odds_cache.json (un solo mercado) al histórico de capturas, una sola vez."""
+    if not os.path.exists(ODDS_CACHE_FILE):
+        return
+    try:
+        with open(ODDS_CACHE_FILE, 'r') as f:
+            cache = json.load(f)
+        data, market = cache['data'], cache['market']
+        fetched_at = datetime.strptime(cache['timestamp'], "%d/%m/%Y %H:%M:%S").astimezone()
+    except (ValueError, KeyError, TypeError):
+        data = None  # fichero corrupto: no hay nada que conservar
+    if data:
+        save_snapshot(data, market, fetched_at=fetched_at)
+    os.remove(ODDS_CACHE_FILE)
+
+# Detección de valor: probabilidades sin margen de cada casa contra el consenso del mercado
+SHARP_BOOKS = ('pinnacle', 'betfair_ex_eu', 'betfair_ex_uk', 'matchbook')
+VALUE_THRESHOLDS = {'h2h': 0.05, 'spreads': 0.04, 'totals': 0.04}
+DEFAULT_PROP_THRESHOLD = 0.08  # mercados de jugador (player_*)
+VALUE_MIN_BOOKS = 3
+ODDS_COLUMNS = ['game_id', 'game', 'home_team', 'away_team', 'commence_time', 'bookmaker_key', 'bookmaker',
+                'market', 'outcome', 'description', 'point', 'price']
+
+def normalize_odds(odds_data):
+    """
+    Aplana la respuesta de la API en una fila por partido × casa × mercado × resultado.
+    `description` es el jugador en los mercados de props ('' en el resto) y `point` la línea.
+    """
+    rows = [
+        (game.get('id'), f"{game['away_team']} @ {game['home_team']}", game['home_team'], game['away_team'],
+         game.get('commence_time'), bm.get('key', ''), bm.get('title', ''), market.get('key'),
+         out.get('name'), out.get('description', ''), out.get('point'), out.get('price'))
+        for game in odds_data or []
+        for bm in game.get('bookmakers', [])
+        for market in bm.get('markets', [])
+        for out in market.get('outcomes', [])
+    ]
+    odds = pd.DataFrame(rows, columns=ODDS_COLUMNS)
+    odds['point'] = pd.to_numeric(odds['point'], errors='coerce')
+    odds['price'] = pd.to_numeric(odds['price'], errors='coerce')
+    return odds[odds['price'] > 1].reset_index(drop=True)
+
+def _value_threshold(market, thresholds):
+    if market in thresholds:
+        return thresholds[market]
+    return DEFAULT_PROP_THRESHOLD if str(market).startswith('player_') else VALUE_THRESHOLDS.get(market, 0.05)
+
+def _selection_label(odds):
+    point = odds['point'].map(lambda p: '' if pd.isna(p) else f" {p:g}")
+    spread = odds['point'].map(lambda p: '' if pd.isna(p) else f" {p:+g}")
+    label = odds['outcome'] + point
+    label = label.where(odds['market'] != 'spreads', odds['outcome'] + spread)
+    return label.where(odds['description'] == '', odds['description'] + ' ' + label)
+
+def detect_value_odds(odds_data, market_key=None, threshold=None, thresholds=None, min_books=VALUE_MIN_BOOKS):
+    """
+    Detecta cuotas con valor en todos los mercados del payload (o solo `market_key`).
+    Cada casa se desvigoriza (1/cuota normalizado dentro de su mercado) y se compara con el
+    consenso: la media de las casas sharp si cotizan esa línea o, si no, la mediana del resto.
+    Hay valor cuando cuota × probabilidad de consenso − 1 supera el umbral del mercado
+    (`threshold` fija uno común; `thresholds` sobrescribe los de VALUE_THRESHOLDS).
+    Acepta la respuesta de la API o el DataFrame de `normalize_odds`.
+    """
+    odds = odds_data if isinstance(odds_data, pd.DataFrame) else normalize_odds(odds_data)
+    if market_key is not None:
+        odds = odds[odds['market'] == market_key]
+    if odds.empty:
+        return pd.DataFrame()
+
+    odds = odds.assign(description=odds['description'].fillna(''), side_point=odds['point'].fillna(0.0))
+    # Spreads: cada lado tiene su signo, el mercado de la casa se identifica por la línea absoluta
+    line = odds['side_point'].abs().where(odds['market'] == 'spreads', odds['side_point'])
+    book_keys = [odds['game_id'], odds['market'], odds['description'], line, odds['bookmaker_key']]
+    implied = 1 / odds['price']
+    overround = implied.groupby(book_keys).transform('sum')
+    outcomes = implied.groupby(book_keys).transform('size')
+    odds = odds.assign(fair=implied / overround)[outcomes >= 2]
+    if odds.empty:
+        return pd.DataFrame()
+
+    sel_keys = ['game_id', 'market', 'description', 'side_point', 'outcome']
+    g = odds.groupby(sel_keys)['fair']
+    n_books = g.transform('size')
+    sharp = odds['fair'].where(odds['bookmaker_key'].isin(SHARP_BOOKS))
+    sharp_mean = sharp.groupby([odds[k] for k in sel_keys]).transform('mean')
+    consensus = sharp_mean.fillna(g.transform('median'))
+
+    edge = odds['price'] * consensus - 1
+    limits = odds['market'].map(lambda m: threshold if threshold is not None
+                                else _value_threshold(m, thresholds or {}))
+    mask = (n_books >= min_books) & (edge > limits)
+    hits = odds[mask]
+    if hits.empty:
+        return pd.DataFrame()
+    return pd.DataFrame({
+        'game': hits['game'],
+        'market': hits['market'],
+        'selection': _selection_label(hits),
+        'bookmaker': hits['bookmaker'],
+        'price': hits['price'],
+        'fair_price': (1 / consensus[mask]).round(2),
+        'edge_percent': (edge[mask] * 100).round(1),
+    }).sort_values('edge_percent', ascending=False).reset_index(drop=True)
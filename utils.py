@@ -2,6 +2,8 @@ from datetime import datetime, timedelta
 import streamlit as st
 import requests
 import time
+import threading
+from streamlit.runtime.scriptrunner import add_script_run_ctx
 
 def convertir_hora_espanol(hora_et):
     """Convierte hora ET a hora española. Ajustado a ET+5 para evitar desfase de 1h."""
@@ -35,3 +37,35 @@ def safe_request(url, timeout=5, retries=3):
                 raise e
             time.sleep(2 ** i)
     return None
+
+def run_concurrently(jobs, timeout):
+    """
+    Ejecuta cada job {clave: (función, args)} en su propio hilo, con el contexto de Streamlit,
+    y espera como mucho `timeout` segundos en total.
+    Devuelve (resultados, claves que no terminaron a tiempo). Los jobs que fallan no aparecen en resultados.
+    """
+    results = {}
+    results_lock = threading.Lock()
+    threads = []
+    for key, (fn, args) in jobs.items():
+        def target(key=key, fn=fn, args=args):
+            try:
+                value = fn(*args)
+            except Exception as e:
+                print(f"Error en {key}: {e}")
+                return
+            with results_lock:
+                results[key] = value
+        thread = threading.Thread(target=target, daemon=True)
+        add_script_run_ctx(thread)
+        thread.start()
+        threads.append((key, thread))
+
+    deadline = time.monotonic() + timeout
+    for _, thread in threads:
+        thread.join(max(0.0, deadline - time.monotonic()))
+    # Los hilos que no llegaron siguen vivos y pueden escribir: se trabaja sobre una copia
+    with results_lock:
+        finished = dict(results)
+    pending = [key for key, thread in threads if key not in finished and thread.is_alive()]
+    return finished, pending